@@ -21,9 +21,9 @@ import pandas as pd
 import numpy as np
 
 from contextlib import closing
+from functools import lru_cache
 from hashlib import md5
 from random import uniform
-from scandir import walk
 from unidecode import unidecode
 
 
@@ -61,6 +61,11 @@ class classproperty(object):
         return self.fget(owner_cls)
 
 
+# Values that is_not_null and is_null always consider null (along with numpy.nan)
+_NULL_VALUES = (None, "None", "nan", "", " ", "NaN", "none", "n/a", "NONE", "N/A")
+_NULL_STRINGS = frozenset(v for v in _NULL_VALUES if v is not None)
+
+
 def is_not_null(val, empty_lists_are_null=False, custom_nulls=None):
 
     """
@@ -85,7 +90,10 @@ def is_not_null(val, empty_lists_are_null=False, custom_nulls=None):
         True
     """
 
-    null_values = [None, "None", "nan", "", " ", "NaN", "none", "n/a", "NONE", "N/A"]
+    if isinstance(val, str):
+        # Strings are the most common input, and can be checked with a set lookup
+        return val not in _NULL_STRINGS and not (custom_nulls and val in custom_nulls)
+    null_values = list(_NULL_VALUES)
     if custom_nulls:
         null_values.extend(custom_nulls)
     if type(val) == list:
@@ -217,6 +225,53 @@ def decode_text(text, throw_loud_fail=False):
     return output_text
 
 
+def _get_hash(text, hash_function):
+
+    """
+    Hashes text for :py:func:`pewtils.get_hash`.
+    """
+
+    decoded_text = decode_text(text).encode("utf8").strip()
+    if decoded_text == "":
+        decoded_text = text
+    text = decoded_text
+    if hash_function == "nilsimsa":
+        from nilsimsa import Nilsimsa
+
+        hashed = Nilsimsa(text).hexdigest()
+    elif hash_function == "md5":
+        hashed = md5(text).hexdigest()
+    else:
+        try:
+            import ssdeep
+        except ImportError:
+            raise Exception(
+                """
+                To use get_hash with hash_function='ssdeep' you need to install the ssdeep package. Try running: 
+                    >> BUILD_LIB=1 pip install ssdeep
+                If you encounter installation problems, refer to the pewtils documentation for troubleshooting help.
+            """
+            )
+        hashed = ssdeep.hash(text)
+
+    return hashed
+
+
+# Only strings up to this length are cached by get_hash, so the cache holds at most ~10,000 x 1KB (~10MB) of text
+# rather than whole documents; longer texts are rarely hashed repeatedly and are hashed directly instead
+_HASH_CACHE_MAX_LENGTH = 1024
+
+
+@lru_cache(maxsize=10000)
+def _get_cached_hash(text, hash_function):
+
+    """
+    A memoized version of :py:func:`pewtils._get_hash`, used by :py:func:`pewtils.get_hash` for short strings.
+    """
+
+    return _get_hash(text, hash_function)
+
+
 def get_hash(text, hash_function="ssdeep"):
 
     """
@@ -235,6 +290,9 @@ def get_hash(text, hash_function="ssdeep"):
     3. By default the function uses the :py:mod:`ssdeep` algorithm, which generates context-sensitive hashes that are \
     useful for computing document similarities at scale.
 
+    .. note:: Hashes of strings up to 1,024 characters long are cached (up to 10,000 of them, or roughly 10MB of \
+    text), so hashing the same short text repeatedly is cheap. Longer texts are hashed from scratch every time.
+
     .. note:: Using `hash_function='ssdeep'` requires the :py:mod:`ssdeep` library, which is not installed by default \
     because it requires the installation of additional system libraries on certain operating systems. For help \
     installing ssdeep, refer to the pewtils documentation installation section, which provides OS-specific instructions.
@@ -248,30 +306,11 @@ def get_hash(text, hash_function="ssdeep"):
         '3:HI2:Hl'
     """
 
-    decoded_text = decode_text(text).encode("utf8").strip()
-    if decoded_text == "":
-        decoded_text = text
-    text = decoded_text
-    if hash_function == "nilsimsa":
-        from nilsimsa import Nilsimsa
-
-        hashed = Nilsimsa(text).hexdigest()
-    elif hash_function == "md5":
-        hashed = md5(text).hexdigest()
-    else:
-        try:
-            import ssdeep
-        except ImportError:
-            raise Exception(
-                """
-                To use get_hash with hash_function='ssdeep' you need to install the ssdeep package. Try running: 
-                    >> BUILD_LIB=1 pip install ssdeep
-                If you encounter installation problems, refer to the pewtils documentation for troubleshooting help.
-            """
-            )
-        hashed = ssdeep.hash(text)
-
-    return hashed
+    # Short strings are the common case, and are often hashed repeatedly (e.g. when deduplicating), so their hashes
+    # are cached
+    if isinstance(text, str) and len(text) <= _HASH_CACHE_MAX_LENGTH:
+        return _get_cached_hash(text, hash_function)
+    return _get_hash(text, hash_function)
 
 
 def zipcode_num_to_string(zipcode):
@@ -414,7 +453,7 @@ def scale_range(old_val, old_min, old_max, new_min, new_max):
     ) + float(new_min)
 
 
-def new_random_number(attempt=1, minimum=1.0, maximum=10):
+def new_random_number(attempt=1, minimum=1.0, maximum=10, size=None):
 
     """
     Returns a random number between the boundary that exponentially increases with the number of ``attempt``.
@@ -431,8 +470,11 @@ def new_random_number(attempt=1, minimum=1.0, maximum=10):
     :type minimum: int or float
     :param maximum: The maximum allowed value that can be returned; must be greater than ``minimum``.
     :type maximum: int or float
+    :param size: (Optional) If provided, returns an array of this many random numbers drawn from the same range, \
+    generated all at once with :py:mod:`numpy`
+    :type size: int
     :return: A random number drawn uniformly from across the range determined by the provided arguments.
-    :rtype: float
+    :rtype: float or :py:class:`numpy.ndarray`
 
     .. note:: One useful application of this function is rate limiting: a script can pause in between requests at a \
         reasonably fast pace, but then moderate itself and pause for longer periods if it begins encountering errors, \
@@ -446,9 +488,16 @@ def new_random_number(attempt=1, minimum=1.0, maximum=10):
         1.9835581813820642
         >>> new_random_number(attempt=2)
         3.1022350739064
+        >>> new_random_number(attempt=2, size=3)
+        array([2.41715606, 1.53427946, 3.88209412])
     """
 
-    return uniform(minimum, min(maximum, minimum * 2 ** attempt))
+    # Past 2 ** 1023 the bound can't be represented as a float anyway, so capping the exponent avoids an \
+    # OverflowError (and computing enormous integers) for very large attempt counts
+    upper = min(maximum, minimum * 2 ** min(attempt, 1023))
+    if size is not None:
+        return np.random.uniform(minimum, upper, size)
+    return uniform(minimum, upper)
 
 
 def chunk_list(seq, size):
@@ -460,15 +509,15 @@ def chunk_list(seq, size):
     :type seq: list or iterable
     :param size: Desired size of each sublist
     :type size: int
-    :return: A list of lists
-    :rtype: list
+    :return: A generator that yields each sublist (a slice of the original sequence)
+    :rtype: generator
 
     Usage::
 
         from pewtils import chunk_list
 
         >>> number_sequence = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-        >>> chunk_list(number_sequence, 3)
+        >>> list(chunk_list(number_sequence, 3))
         [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]]
     """
 
@@ -680,7 +729,7 @@ def cached_series_mapper(series, function):
     return series.map(val_map)
 
 
-def multiprocess_group_apply(grp, func, *args, **kwargs):
+def multiprocess_group_apply(grp, func, *args, workers=None, **kwargs):
     """
 
     Apply arbitrary functions to groups or slices of a Pandas DataFrame using multiprocessing, to efficiently \
@@ -695,6 +744,9 @@ def multiprocess_group_apply(grp, func, *args, **kwargs):
     :param func: A function that accepts a Pandas DataFrame representing a group from the original DataFrame
     :type func: function
     :param args: Arguments to be passed to the function
+    :param workers: Number of processes to use (default is the number of CPUs); if 1, the groups are processed \
+    serially in the current process, which avoids the overhead of spinning up a pool for small inputs
+    :type workers: int
     :param kwargs: Keyword arguments to be passed to the function
     :return: The resulting DataFrame
     :rtype: pandas.DataFrame
@@ -748,13 +800,16 @@ def multiprocess_group_apply(grp, func, *args, **kwargs):
 
     """
 
-    results = []
-    pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-    for name, group in grp:
-        results.append(pool.apply_async(func, (group,) + args, kwargs))
-    pool.close()
-    pool.join()
-    results = [r.get() for r in results]
+    if workers == 1:
+        results = [func(group, *args, **kwargs) for name, group in grp]
+    else:
+        results = []
+        pool = multiprocessing.Pool(processes=workers or multiprocessing.cpu_count())
+        for name, group in grp:
+            results.append(pool.apply_async(func, (group,) + args, kwargs))
+        pool.close()
+        pool.join()
+        results = [r.get() for r in results]
 
     if not hasattr(results[0], "__len__") or isinstance(results[0], str):
         # Assume it's an aggregation function
@@ -818,21 +873,20 @@ def extract_json_from_folder(
     attributes = {}
     subdirs = []
     if os.path.exists(folder_path):
-        for path, subdir, files in walk(folder_path):
-            if folder_path == path:
-                for file in files:
-                    if file.endswith(".json"):
-                        key = re.sub(".json", "", file)
-                        with closing(open(os.path.join(path, file), "r")) as infile:
-                            try:
-                                attributes[key] = json.load(infile)
-                            except ValueError:
-                                print("JSON file is invalid: {}".format(file))
-            if subdir:
-                subdirs.append(subdir)
-
-    if include_subdirs and len(subdirs) > 0:
-        for subdir in subdirs[0]:
+        # Only the top level is listed here; subfolders are handled by the recursive calls below, so walking the
+        # whole tree up front would list everything beneath them again at every level
+        path, subdirs, files = next(os.walk(folder_path), (folder_path, [], []))
+        for file in files:
+            if file.endswith(".json"):
+                key = re.sub(".json", "", file)
+                with closing(open(os.path.join(path, file), "r")) as infile:
+                    try:
+                        attributes[key] = json.load(infile)
+                    except ValueError:
+                        print("JSON file is invalid: {}".format(file))
+
+    if include_subdirs:
+        for subdir in subdirs:
             if subdir != "__pycache__":
                 results = extract_json_from_folder(
                     os.path.join(folder_path, subdir),
@@ -898,59 +952,56 @@ def extract_attributes_from_folder_modules(
     attributes = {}
     subdirs = []
     if os.path.exists(folder_path):
-        for path, subdir_list, files in walk(folder_path):
-            if folder_path == path:
-                for file in files:
-                    if file.endswith(".py") and not file.startswith("__init__"):
-                        file_name = file.split(".")[0]
-                        module_name = re.sub(
-                            "/",
-                            ".",
-                            re.sub(
-                                module_location,
-                                "",
-                                os.path.splitext(os.path.join(path, file))[0],
-                            ),
-                        ).strip(".")
-                        if module_name in sys.modules:
-                            module = sys.modules[module_name]
-                            # https://github.com/ansible/ansible/issues/13110
-                        else:
+        # Only the top level is listed here; subfolders are handled by the recursive calls below
+        path, subdirs, files = next(os.walk(folder_path), (folder_path, [], []))
+        for file in files:
+            if file.endswith(".py") and not file.startswith("__init__"):
+                file_name = file.split(".")[0]
+                module_name = re.sub(
+                    "/",
+                    ".",
+                    re.sub(
+                        module_location,
+                        "",
+                        os.path.splitext(os.path.join(path, file))[0],
+                    ),
+                ).strip(".")
+                if module_name in sys.modules:
+                    module = sys.modules[module_name]
+                    # https://github.com/ansible/ansible/issues/13110
+                else:
+                    try:
+                        module = SourceFileLoader(
+                            module_name, os.path.join(path, file)
+                        ).load_module()
+                    except NameError:
+                        file, pathname, description = imp.find_module(
+                            file_name, [path]
+                        )
+                        warnings.simplefilter("error", RuntimeWarning)
+                        try:
+                            module = imp.load_module(
+                                module_name, file, pathname, description
+                            )
+                        except RuntimeWarning:
                             try:
-                                module = SourceFileLoader(
-                                    module_name, os.path.join(path, file)
-                                ).load_module()
-                            except NameError:
-                                file, pathname, description = imp.find_module(
-                                    file_name, [path]
+                                module = imp.load_module(
+                                    module_name.split(".")[-1],
+                                    file,
+                                    pathname,
+                                    description,
                                 )
-                                warnings.simplefilter("error", RuntimeWarning)
-                                try:
-                                    module = imp.load_module(
-                                        module_name, file, pathname, description
-                                    )
-                                except RuntimeWarning:
-                                    try:
-                                        module = imp.load_module(
-                                            module_name.split(".")[-1],
-                                            file,
-                                            pathname,
-                                            description,
-                                        )
-                                    except RuntimeWarning:
-                                        module = None
-                                    except (ImportError, AttributeError):
-                                        module = None
-                                except (ImportError, AttributeError):
-                                    module = None
-                        if hasattr(module, attribute_name):
-                            attributes[file_name] = getattr(module, attribute_name)
-
-            if subdir_list:
-                subdirs.extend(subdir_list)
+                            except RuntimeWarning:
+                                module = None
+                            except (ImportError, AttributeError):
+                                module = None
+                        except (ImportError, AttributeError):
+                            module = None
+                if hasattr(module, attribute_name):
+                    attributes[file_name] = getattr(module, attribute_name)
 
     if include_subdirs:
-        for subdir in set(subdirs):
+        for subdir in subdirs:
             results = extract_attributes_from_folder_modules(
                 os.path.join(folder_path, subdir),
                 attribute_name,
@@ -1005,6 +1056,7 @@ class PrintExecutionTime(object):
 
     :param label: A label to print alongside the execution time
     :param stdout: a StringIO-like output stream (sys.stdout by default)
+    :param clock: A function that returns the current time in seconds (:py:func:`time.time` by default)
 
     Usage::
 
@@ -1015,18 +1067,19 @@ class PrintExecutionTime(object):
 
     """
 
-    def __init__(self, label=None, stdout=None):
+    def __init__(self, label=None, stdout=None, clock=None):
         self.start_time = None
         self.end_time = None
         self.label = label
         self.stdout = sys.stdout if not stdout else stdout
+        self.clock = time.time if not clock else clock
 
     def __enter__(self):
-        self.start_time = time.time()
+        self.start_time = self.clock()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.end_time = time.time()
+        self.end_time = self.clock()
         if self.label:
             self.stdout.write(
                 "{}: {} seconds".format(self.label, self.end_time - self.start_time)
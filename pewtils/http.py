@@ -1,17 +1,31 @@
 from __future__ import division
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from builtins import str
-from pewtils import get_hash, decode_text, is_not_null
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import blake2b, md5
+from pewtils import decode_text
+from pewtils.regex import extract_domain, extract_url
 from six.moves.urllib import parse as urlparse
 from unidecode import unidecode
+import lxml.etree
+import lxml.html
 import pandas as pd
 import re
 import os
 import requests
+import requests.adapters
+import threading
+import time
 import tldextract
-import warnings
 from requests.exceptions import ReadTimeout
-from stopit import ThreadingTimeout as Timeout
+
+try:
+    # google-re2 guarantees linear-time matching on arbitrary HTML, but isn't required
+    import re2
+except ImportError:
+    re2 = None
 
 
 _ = pd.read_csv(
@@ -19,7 +33,7 @@ _ = pd.read_csv(
         os.path.dirname(os.path.abspath(__file__)), "general_link_shorteners.csv"
     )
 )
-GENERAL_LINK_SHORTENERS = _["shortener"].values
+GENERAL_LINK_SHORTENERS = frozenset(_["shortener"])
 
 
 _ = pd.read_csv(
@@ -27,21 +41,82 @@ _ = pd.read_csv(
         os.path.dirname(os.path.abspath(__file__)), "vanity_link_shorteners.csv"
     )
 )
-_ = _[_["historical"] == 0]
-VANITY_LINK_SHORTENERS = dict(zip(_["shortener"], _["expanded"]))
-
-_ = pd.read_csv(
-    os.path.join(
-        os.path.dirname(os.path.abspath(__file__)), "vanity_link_shorteners.csv"
-    )
+VANITY_LINK_SHORTENERS = dict(
+    zip(_[_["historical"] == 0]["shortener"], _[_["historical"] == 0]["expanded"])
+)
+HISTORICAL_VANITY_LINK_SHORTENERS = dict(
+    zip(_[_["historical"] == 1]["shortener"], _[_["historical"] == 1]["expanded"])
 )
-_ = _[_["historical"] == 1]
-HISTORICAL_VANITY_LINK_SHORTENERS = dict(zip(_["shortener"], _["expanded"]))
 
 VANITY_LINK_SHORTENERS.update(HISTORICAL_VANITY_LINK_SHORTENERS)
 
+_LINK_SHORTENERS = GENERAL_LINK_SHORTENERS.union(VANITY_LINK_SHORTENERS)
+
+# Maps (url, user_agent) to (time resolved, canonical url), in least-recently used order
+_CANONICAL_LINK_CACHE = OrderedDict()
+_CANONICAL_LINK_CACHE_SIZE = 100000
+_CANONICAL_LINK_CACHE_LOCK = threading.Lock()
+
+# Connection pools are shared by the sessions that are created when one isn't passed in; cookies aren't
+_DEFAULT_ADAPTER = requests.adapters.HTTPAdapter(pool_connections=64, pool_maxsize=64)
+
+_EMPTY_PATHS = ("/", "")
+_BAD_STATUS_CODES = frozenset([302, 307, 400, 404, 405, 407, 500, 501, 502, 503, 504, 520, 530])
+_PROXY_REQUIRED = frozenset([307, 407])
+_CHECK_LENGTH = frozenset([301, 302, 200, 404])
+# How many links embedded in the GET parameters of redirects canonical_link will follow before ignoring them
+_MAX_EMBEDDED_REDIRECTS = 5
+# Generic TLDs with no (ICANN) public suffixes below them, for which _fast_domain can skip tldextract
+_FAST_DOMAIN_SUFFIXES = frozenset(["com", "org", "net", "edu", "gov"])
+_DEFAULT_BREAK_TAGS = ("strong", "em", "i", "b", "p")
+
+_WHITESPACE_REGEX = re.compile(r"\s+")
+# A leading "scheme://" or protocol-relative "//", stripped the same way tldextract does before it finds the host
+_URL_SCHEME_REGEX = re.compile(r"^([a-z0-9+.-]+:)?//", re.IGNORECASE)
+# Runs of two or more whitespace characters, or any single character that str.splitlines treats as a line break
+_TEXT_BLOCK_SPLIT_REGEX = re.compile(r"\s{2,}|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+_INLINE_WHITESPACE_REGEX = re.compile(r"[^\S\n]+")
+_SPACING_TRANSLATION = str.maketrans({"\t": " ", "\n": "\n\n"})
+_REPEATED_A_REGEX = re.compile(r"(\sA){2,}\s")
+_CLEANUP_TAG_REGEX = re.compile(r"<(?:script|style|br)\b", re.IGNORECASE)
+_BODY_TAG_REGEX = re.compile(r"<body\b", re.IGNORECASE)
+_NON_TEXT_BLOCK_REGEX = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL
+)
+_BODY_STRAINER = SoupStrainer("body")
+# Matches the same elements as lxml's find_class("menu") and find_class("header"), in a single pass
+_MENU_HEADER_XPATH = lxml.etree.XPath(
+    "descendant-or-self::*[@class and ("
+    "contains(concat(' ', normalize-space(@class), ' '), ' menu ') or "
+    "contains(concat(' ', normalize-space(@class), ' '), ' header '))]"
+)
+# Patterns without Unicode-aware classes like \s behave identically in RE2, so they can use it when it's installed
+_TAG_REGEX = (re2 or re).compile(r"<[^>]*>")
+_SIMPLE_BREAK_REGEX = (re2 or re).compile(r"</?div>|</?p>|<br>")
+_SIMPLE_TAG_REGEX = (re2 or re).compile(r"<[^>\n]+>")
+_ID_PARAM_REGEX = re.compile(r"document|article|id|qs", re.IGNORECASE)
+_URL_PARAM_REGEX = re.compile(r"html|http", re.IGNORECASE)
+
 
-def hash_url(url):
+def _get_default_session(user_agent):
+
+    """
+    Returns a new :py:class:`requests.Session` for the given user agent, mounted on the module-level connection \
+    pool. Bulk link resolution reuses pooled connections (and their TLS handshakes) to the same shortener hosts \
+    instead of opening new ones for every link, but each call still gets its own cookies, so consent, paywall or \
+    tracking cookies set while resolving one link don't change the redirects for the next. The session shouldn't \
+    be closed, since that would close the shared pool.
+    """
+
+    session = requests.Session()
+    session.headers.update({"User-Agent": user_agent})
+    session.mount("http://", _DEFAULT_ADAPTER)
+    session.mount("https://", _DEFAULT_ADAPTER)
+    return session
+
+
+@lru_cache(maxsize=131072)
+def hash_url(url, hash_function="md5"):
 
     """
     Clears out http/https prefix and returns an MD5 hash of the URL. More effective \
@@ -49,9 +124,16 @@ def hash_url(url):
 
     :param url: The URL to hash
     :type url: str
-    :return: Hashed string representation of the URL using the md5 hashing algorithm.
+    :param hash_function: The hashing algorithm to use; options are ``'md5'`` (default) and ``'blake2b'``. \
+    BLAKE2b (with a 128-bit digest, the same length as MD5) is faster for bulk hashing, but produces different \
+    hashes, so stick with MD5 when comparing against previously hashed URLs.
+    :type hash_function: str
+    :return: Hashed string representation of the URL using the selected hashing algorithm.
     :rtype: str
 
+    .. note:: Results are memoized, since URL datasets tend to contain many duplicates. Call \
+        ``hash_url.cache_clear()`` to free the cache, or ``hash_url.cache_info()`` to inspect its hit rate.
+
     Usage::
 
         from pewtils.http import hash_url
@@ -63,13 +145,81 @@ def hash_url(url):
 
     """
 
-    http_regex = re.compile(r"^http(s)?\:\/\/")
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        result = get_hash(
-            unidecode(http_regex.sub("", url.lower())), hash_function="md5"
-        )
-        return result
+    # Same as stripping pewtils.regex.HTTP_REGEX, but a literal prefix check avoids the regex overhead, which \
+    # dominates the cost of hashing a short string
+    url = url.lower()
+    if url.startswith("https://"):
+        url = url[8:]
+    elif url.startswith("http://"):
+        url = url[7:]
+    if not url.isascii():
+        # Transliterating is a no-op for plain ASCII (the vast majority of URLs), so we only do it when needed
+        url = unidecode(url)
+    url = url.encode("utf8").strip()
+    if hash_function == "md5":
+        # Equivalent to get_hash(url, hash_function="md5") without the decoding and dispatch overhead
+        return md5(url).hexdigest()
+    elif hash_function == "blake2b":
+        return blake2b(url, digest_size=16).hexdigest()
+    else:
+        raise Exception("Unsupported hash function: {}".format(hash_function))
+
+
+def _strip_html_lxml(html, break_tags):
+
+    """
+    Extracts the text from an HTML document for :py:func:`pewtils.http.strip_html` by manipulating the \
+    :py:mod:`lxml` tree directly, which is considerably faster than building a BeautifulSoup tree.
+    """
+
+    tree = lxml.html.document_fromstring(html)
+    # drop_tree preserves the text that follows each element, like BeautifulSoup's extract does
+    # Most documents have nothing to clean up, so we only walk the tree for things that appear in the raw HTML
+    if "menu" in html or "header" in html:
+        for tag in _MENU_HEADER_XPATH(tree):
+            tag.drop_tree()
+    if _CLEANUP_TAG_REGEX.search(html):
+        # Scripts and styles can't contain line breaks, so both can be handled in the same walk
+        for tag in list(tree.iter("script", "style", "br")):
+            if tag.tag == "br":
+                tag.tail = "\n{0}".format(tag.tail or "")
+            tag.drop_tree()
+    for t in list(tree.iter(*break_tags)):
+        t.tail = "\n{0}\n{1}".format(t.text_content(), t.tail or "")
+        t.drop_tree()
+    body = tree.find("body")
+    if body is not None:
+        return body.text_content()
+    else:
+        return tree.text_content()
+
+
+def _strip_html_soup(html, break_tags):
+
+    """
+    Extracts the text from an HTML document for :py:func:`pewtils.http.strip_html` using BeautifulSoup.
+    """
+
+    # Only the body's text is returned when there is one, so there's no need to build the rest of the tree
+    parse_only = _BODY_STRAINER if _BODY_TAG_REGEX.search(html) else None
+    soup = BeautifulSoup(html, "lxml", parse_only=parse_only)
+    for tag in soup.select(".menu, .header"):
+        # Nested matches may already have been removed along with their parent
+        if not tag.decomposed:
+            tag.decompose()
+    for tag in soup(["script", "style"]):
+        tag.extract()
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+    for t in soup(break_tags):
+        try:
+            t.replace_with("\n{0}\n".format(t.text))
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            t.replace_with("\n{0}\n".format(decode_text(t.text)))
+    if hasattr(soup, "body") and soup.body:
+        return soup.body.get_text()
+    else:
+        return soup.get_text()
 
 
 def strip_html(html, simple=False, break_tags=None):
@@ -101,41 +251,22 @@ def strip_html(html, simple=False, break_tags=None):
 
     """
 
-    html = re.sub(r"\n", " ", html)
-    html = re.sub(r"\s+", " ", html)
+    html = _WHITESPACE_REGEX.sub(" ", html)
     if not break_tags:
-        break_tags = ["strong", "em", "i", "b", "p"]
+        break_tags = _DEFAULT_BREAK_TAGS
     if not simple:
         try:
-
-            split_re = re.compile(r"\s{2,}")
-            soup = BeautifulSoup(html, "lxml")
-            for tag in soup():
-                if (
-                    "class" in tag.attrs
-                    and ("menu" in tag.attrs["class"] or "header" in tag.attrs["class"])
-                ) or ("menu" in str(tag.id) or "header" in str(tag.id)):
-                    tag.extract()
-            for tag in soup(["script", "style"]):
-                tag.extract()
-            for br in soup.find_all("br"):
-                br.replace_with("\n")
-            for t in soup(break_tags):
-                try:
-                    t.replace_with("\n{0}\n".format(t.text))
-                except (UnicodeDecodeError, UnicodeEncodeError):
-                    t.replace_with("\n{0}\n".format(decode_text(t.text)))
-            if hasattr(soup, "body") and soup.body:
-                text = soup.body.get_text()
-            else:
-                text = soup.get_text()
-            lines = [l.strip() for l in text.splitlines()]
-            lines = [l2.strip() for l in lines for l2 in split_re.split(l)]
-            text = "\n".join([l for l in lines if l])
-            text = re.sub(r"(\sA){2,}\s", " ", text)
-            text = re.sub(r"\n+(\s+)?", "\n\n", text)
-            text = re.sub(r" +", " ", text)
-            text = re.sub(r"\t+", " ", text)
+            try:
+                text = _strip_html_lxml(html, break_tags)
+            except Exception:
+                # lxml refuses some input (e.g. empty documents) that BeautifulSoup is more forgiving about
+                text = _strip_html_soup(html, break_tags)
+            # Equivalent to splitting into lines and then splitting each line on runs of whitespace, in a single pass
+            lines = (l.strip() for l in _TEXT_BLOCK_SPLIT_REGEX.split(text))
+            text = "\n".join(filter(None, lines))
+            # Every line is now stripped and contains no runs of whitespace, so collapsing newlines, spaces and \
+            # tabs reduces to a single character-level translation
+            text = _REPEATED_A_REGEX.sub(" ", text).translate(_SPACING_TRANSLATION)
 
             return text
 
@@ -143,18 +274,17 @@ def strip_html(html, simple=False, break_tags=None):
 
             print("strip_html error")
             print(e)
-            text = re.sub(r"<[^>]*>", " ", re.sub("\\s+", " ", html)).strip()
+            # Comments, CDATA and script/style blocks can contain text (including ">") that would otherwise leak
+            # through the naive tag pattern
+            text = _TAG_REGEX.sub(" ", _NON_TEXT_BLOCK_REGEX.sub(" ", html)).strip()
             return text
 
     else:
-        return "\n".join(
-            [
-                re.sub(r"\s+", " ", re.sub(r"\<[^\>]+\>", " ", section))
-                for section in re.sub(r"\<\/?div\>|\<\/?p\>|\<br\>", "\n", html).split(
-                    "\n"
-                )
-            ]
-        )
+        # The input has no newlines left at this point, so the ones inserted at block tags delimit the sections and \
+        # each pass below can run over the whole string without crossing them
+        text = _SIMPLE_BREAK_REGEX.sub("\n", html)
+        text = _SIMPLE_TAG_REGEX.sub(" ", text)
+        return _INLINE_WHITESPACE_REGEX.sub(" ", text)
 
 
 def trim_get_parameters(url, session=None, timeout=30, user_agent=None):
@@ -185,67 +315,105 @@ def trim_get_parameters(url, session=None, timeout=30, user_agent=None):
 
     """
 
-    close_session = False
     if not session:
-        close_session = True
-        session = requests.Session()
-        session.headers.update({"User-Agent": user_agent})
+        session = _get_default_session(user_agent)
 
     # Often there's extra information about social sharing and referral sources that can be removed
     ditch_params = []
-    parsed = urlparse.urlparse(url)
+    parsed = urlparse.urlsplit(url)
     if parsed.query:
         params = urlparse.parse_qs(parsed.query)
+        # Only single-valued parameters are kept; the (key, value) pairs can be passed straight to urlencode
+        single_params = [(k, v[0]) for k, v in params.items() if len(v) == 1]
+        candidates = []
         for k, v in params.items():
             # We iterate over all of the GET parameters and try holding each one out
-            check = True
-            for skipper in ["document", "article", "id", "qs"]:
-                # If the parameter is named something that's probably a unique ID, we'll keep it
-                if skipper in k.lower():
-                    check = False
-            for skipper in ["html", "http"]:
-                # Same goes for parameters that contain URL information
-                if skipper in v[0].lower():
-                    check = False
-            if check:
-                new_params = {
-                    k2: v2[0] for k2, v2 in params.items() if k2 != k and len(v2) == 1
-                }
-                new_params = urlparse.urlencode(new_params)
-                new_parsed = parsed._replace(query=new_params)
-                new_url = urlparse.urlunparse(new_parsed)
-                try:
-                    resp = session.head(new_url, allow_redirects=True, timeout=timeout)
-                except ReadTimeout:
-                    resp = None
-                if is_not_null(resp):
-                    new_parsed = urlparse.urlparse(resp.url)
-                    if new_parsed.query != "" or new_parsed.path not in ["", "/"]:
-                        # If removing a parameter didn't redirect to a root domain...
-                        new_url = resp.url
-                        compare_new = (
-                            new_url.split("?")[0] if "?" in new_url else new_url
-                        )
-                        compare_old = url.split("?")[0] if "?" in url else url
-                        if compare_new == compare_old:
-                            # And the domain is the same as it was before, then the parameter was probably unnecessary
-                            ditch_params.append(k)
+            # If the parameter is named something that's probably a unique ID, we'll keep it
+            # Same goes for parameters that contain URL information
+            if not _ID_PARAM_REGEX.search(k) and not _URL_PARAM_REGEX.search(v[0]):
+                candidates.append(k)
+
+        compare_old = url.split("?")[0] if "?" in url else url
+
+        def _can_drop(group):
+            group = frozenset(group)
+            new_params = [(k, v) for k, v in single_params if k not in group]
+            new_url = urlparse.urlunsplit(
+                parsed._replace(query=urlparse.urlencode(new_params))
+            )
+            try:
+                resp = session.head(new_url, allow_redirects=True, timeout=timeout)
+            except ReadTimeout:
+                return False
+            new_parsed = urlparse.urlsplit(resp.url)
+            if new_parsed.query != "" or new_parsed.path not in _EMPTY_PATHS:
+                # If removing the parameters didn't redirect to a root domain...
+                new_url = resp.url
+                compare_new = new_url.split("?")[0] if "?" in new_url else new_url
+                # And the domain is the same as it was before, then the parameters were probably unnecessary
+                return compare_new == compare_old
+            return False
+
+        # Most parameters turn out to be removable, so rather than holding them out one at a time, we start by
+        # dropping them all at once and only split the group in half (down to individual parameters) when that fails
+        groups = [candidates] if candidates else []
+        if groups:
+            # Each probe is a separate round trip, so we issue them concurrently over the session's connection pool,
+            # reusing the same worker threads for every round of splitting
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                while groups:
+                    results = list(executor.map(_can_drop, groups))
+                    next_groups = []
+                    for group, can_drop in zip(groups, results):
+                        if can_drop:
+                            ditch_params.extend(group)
+                        elif len(group) > 1:
+                            half = len(group) // 2
+                            next_groups.extend([group[:half], group[half:]])
+                    groups = next_groups
 
     if len(ditch_params) > 0:
         # Now we remove all of the unnecessary get parameters and finalize the URL
-        new_params = {
-            k: v[0] for k, v in params.items() if len(v) == 1 and k not in ditch_params
-        }
+        ditch_params = frozenset(ditch_params)
+        new_params = [(k, v) for k, v in single_params if k not in ditch_params]
         new_params = urlparse.urlencode(new_params)
         parsed = parsed._replace(query=new_params)
-        url = urlparse.urlunparse(parsed)
-
-    if close_session:
-        session.close()
+        url = urlparse.urlunsplit(parsed)
 
     return url
 
 
+def _url_host(url):
+
+    """
+    Returns the network location of a URL (everything between the scheme and the path, query or fragment), or the \
+    URL itself if it doesn't have one. Only a leading scheme is stripped, so links embedded in the query string of \
+    a scheme-less URL are ignored.
+    """
+
+    host = _URL_SCHEME_REGEX.sub("", url, count=1)
+    for delimiter in ["/", "?", "#"]:
+        host = host.split(delimiter, 1)[0]
+    return host or url
+
+
+def _fast_domain(host):
+
+    """
+    Returns the host if it's of the simple lowercase ``domain.tld`` form (no subdomain, port, or credentials) on one \
+    of a handful of common generic TLDs, which covers most links and lets us skip the public suffix lookup in \
+    :py:func:`tldextract.extract`. None of those TLDs have public suffixes below them, so for these hosts \
+    :py:func:`tldextract.extract` always splits off the whole TLD and returns the host unchanged. Returns None for \
+    anything else.
+    """
+
+    if host.count(".") == 1 and host.isascii() and host.islower():
+        name, suffix = host.split(".")
+        if suffix in _FAST_DOMAIN_SUFFIXES and name and name.replace("-", "").isalnum():
+            return host
+    return None
+
+
 def extract_domain_from_url(
     url,
     include_subdomain=True,
@@ -303,7 +471,25 @@ def extract_domain_from_url(
         url = canonical_link(
             url, timeout=timeout, session=session, user_agent=user_agent
         )
-    domain = tldextract.extract(url)
+    # The domain only depends on the host, so links to different pages on the same site share a cache entry
+    return _extract_domain(_url_host(url), include_subdomain, expand_shorteners)
+
+
+@lru_cache(maxsize=100000)
+def _extract_domain(host, include_subdomain, expand_shorteners):
+
+    """
+    Extracts the domain from a URL's host for :py:func:`pewtils.http.extract_domain_from_url`. This step doesn't \
+    involve any network requests, so results are memoized.
+    """
+
+    if include_subdomain:
+        domain = _fast_domain(host)
+        if domain:
+            if expand_shorteners:
+                domain = VANITY_LINK_SHORTENERS.get(domain, domain)
+            return domain
+    domain = tldextract.extract(host)
     if domain:
         if include_subdomain and domain.subdomain and domain.subdomain != "www":
             domain = ".".join([domain.subdomain, domain.domain, domain.suffix])
@@ -314,7 +500,184 @@ def extract_domain_from_url(
     return domain
 
 
-def canonical_link(url, timeout=5.0, session=None, user_agent=None):
+def _is_link_shortener(netloc):
+
+    """
+    Checks whether a host belongs to a known link shortener. Any subdomain of a general shortening service (e.g. \
+    ``www.bit.ly``) is also treated as a shortener. Vanity shorteners have to match exactly, since many of them are \
+    alternate domains for websites that serve real pages on their subdomains (e.g. ``huffpost.com``).
+    """
+
+    if netloc in _LINK_SHORTENERS:
+        return True
+    labels = netloc.split(".")
+    return any(
+        ".".join(labels[i:]) in GENERAL_LINK_SHORTENERS for i in range(1, len(labels) - 1)
+    )
+
+
+def _looks_canonical(url):
+
+    """
+    Cheap check for URLs that are unlikely to redirect anywhere more informative: the host isn't a known link \
+    shortener, the path is long enough that it isn't an unrecognized shortened link, and none of the GET \
+    parameters look like a URL being redirected to.
+    """
+
+    parsed = urlparse.urlsplit(url)
+    if _is_link_shortener(parsed.netloc) or len(parsed.path) <= 8:
+        return False
+    for val in urlparse.parse_qs(parsed.query).values():
+        if any(v.startswith("http") for v in val):
+            return False
+    return True
+
+
+def _follow_redirects(url, session, timeout, stop_at_canonical=False):
+
+    """
+    Issues a HEAD request and follows its redirects one hop at a time, returning the final response along with a \
+    list of ``(status_code, url)`` tuples for every hop. If the chain breaks partway through with a connection error, \
+    only the first hop is returned, as though it had been requested with ``allow_redirects=False``. If \
+    ``stop_at_canonical`` is True, no further hops are requested once one passes \
+    :py:func:`pewtils.http._looks_canonical`.
+    """
+
+    first = session.head(url, allow_redirects=False, timeout=timeout, stream=True)
+    response = first
+    history = [(first.status_code, first.url)]
+    try:
+        for response in session.resolve_redirects(
+            first, first.request, timeout=timeout, stream=True
+        ):
+            history.append((response.status_code, response.url))
+            if stop_at_canonical and _looks_canonical(response.url):
+                break
+    except requests.ConnectionError:
+        response, history = first, history[:1]
+    finally:
+        # We only need the status codes and URLs, so we release the connection back to the pool right away
+        response.close()
+
+    return response, history
+
+
+def _pick_canonical_url(history, follow_embedded):
+
+    """
+    Walks the ``(status_code, url)`` hops of a redirect chain for :py:func:`pewtils.http.canonical_link` and picks \
+    the most informative URL. Returns a tuple of the chosen URL, the status code of the last hop that was \
+    inspected, and a URL embedded in the GET parameters of an intermediate hop if one was found (in which case the \
+    chosen URL is None, since the embedded link should be resolved instead).
+    """
+
+    # Parse each hop and build its comparison keys (ignoring protocol, and ignoring casing) once up front;
+    # the loop below only compares them
+    history = [
+        (
+            status_code,
+            response_url,
+            urlparse.urlsplit(response_url),
+            (response_url.replace("https", "http"), response_url.lower()),
+        )
+        for status_code, response_url in history
+    ]
+    last_good_url = history[0][1]
+    last_good_keys = history[0][3]
+    original_parsed = history[0][2]
+    has_path = original_parsed.path not in _EMPTY_PATHS
+    has_query = original_parsed.query != ""
+    prev_was_shortener = False
+    prev_path = None
+    prev_query = None
+    status_code = None
+    for i, (status_code, response_url, parsed, keys) in enumerate(history):
+        if "errors/404" in response_url:
+            # If it's clearly a 404 landing page, stop and use the last observed good URL
+            break
+        netloc, path, query = parsed.netloc, parsed.path, parsed.query
+        # Don't consider known shortened URLs
+        is_shortener = _is_link_shortener(netloc)
+        if not is_shortener:
+            if i != 0 and follow_embedded:
+                for param, val in urlparse.parse_qs(query).items():
+                    if len(val) == 1 and val[0].startswith("http"):
+                        parsed_possible_url = urlparse.urlsplit(val[0])
+                        if parsed_possible_url.scheme and parsed_possible_url.netloc:
+                            # If the URL contains a GET parameter that is, itself, a URL, it's likely redirecting
+                            # to it, so we're going to stop this run and start the process over with the new URL
+                            return None, status_code, val[0]
+            if status_code in _PROXY_REQUIRED:
+                # These codes tend to indicate the last good URL in the chain
+                last_good_url = response_url
+                break
+            good_path = not has_path or path not in _EMPTY_PATHS
+            good_query = not has_query or query != ""
+            # If the URL has a path or some GET parameters, we'll inspect further
+            # Otherwise we just go with the previous URL
+            # Link shorteners are very rarely used to reference root domains
+            if good_query or good_path:
+                if (
+                    keys[0] == last_good_keys[0] or path == original_parsed.path
+                ) or keys[1] == last_good_keys[1]:
+                    # If it's the same link but only the domain, protocol, or casing changed, it's fine
+                    last_good_url, last_good_keys = response_url, keys
+                elif i != 0 and status_code in _CHECK_LENGTH:
+                    # For these codes, we're going to see how much the link changed
+                    # Redirects and 404s sometimes preserve a decent URL, sometimes they go to a landing page
+                    # The following cutoffs seem to do a good job most of the time:
+                    # 1) The new URL has a long domain more than 7 characters, so it's not likely a shortened URL
+                    # 2) The prior URL had a long path and this one has fewer than 20 characters and it wasn't
+                    # swapped out for GET params
+                    # 3) Or the prior URL had GET params and this one has far fewer and no replacement path
+                    # If these conditions are met and the path or query do not identically match the prior link
+                    # Then it's usually a generic error page
+                    bad = False
+                    if (
+                        has_path
+                        and len(netloc) > 7
+                        and len(path) < 20
+                        and len(query) == 0
+                        and prev_path != path
+                    ) or (
+                        has_query
+                        and len(netloc) > 7
+                        and len(query) < 20
+                        and len(path) <= 1
+                        and prev_query != query
+                    ):
+                        bad = True
+                    if not bad or prev_was_shortener:
+                        last_good_url, last_good_keys = response_url, keys
+                        # print("GOOD: {}, {}".format(status_code, response_url))
+                    else:
+                        # These can sometimes resolve further though, so we continue onward
+                        prev_path = None
+                        prev_query = None
+                else:
+                    if status_code not in _BAD_STATUS_CODES:
+                        last_good_url, last_good_keys = response_url, keys
+                    else:
+                        break
+            else:
+                # Resolved to a general URL
+                break
+
+        prev_was_shortener = is_shortener
+        prev_path = path
+        prev_query = query
+
+    return last_good_url, status_code, None
+
+
+def canonical_link(
+    url,
+    timeout=5.0,
+    session=None,
+    user_agent=None,
+    use_cache=True,
+    shorteners_only=False,
+):
 
     """
     Tries to resolve a link to the "most correct" version.
@@ -336,6 +699,15 @@ def canonical_link(url, timeout=5.0, session=None, user_agent=None):
     :param user_agent: User agent for the auto-created requests Session to use, if a preconfigured requests Session \
     is not provided
     :type user_agent: str
+    :param use_cache: Whether to reuse the results of previous successful resolutions of the same URL, user \
+    agent and ``shorteners_only`` setting (default is True). Use :py:func:`pewtils.http.clear_url_caches` to empty the cache.
+    :type use_cache: bool
+    :param shorteners_only: If True, URLs that don't look like they need resolving (they aren't from a known link \
+    shortener, have a reasonably long path, and don't contain a URL in their GET parameters) are returned as-is \
+    without making any requests. Much faster for large batches of mostly-canonical links, but skips status checks \
+    and redirects on those URLs. Redirect chains are likewise followed only until they reach such a URL. \
+    (default is False)
+    :type shorteners_only: bool
     :return: The "canonical" URL as supplied by the server, or the original URL if none supplied.
     :rtype: str
 
@@ -354,160 +726,160 @@ def canonical_link(url, timeout=5.0, session=None, user_agent=None):
 
     """
 
-    BAD_STATUS_CODES = [
-        302,
-        307,
-        400,
-        404,
-        405,
-        407,
-        500,
-        501,
-        502,
-        503,
-        504,
-        520,
-        530,
-        404,
-    ]
-    PROXY_REQUIRED = [307, 407]
-    CHECK_LENGTH = [301, 302, 200, 404]
+    # Resolutions with shorteners_only can stop partway through a redirect chain, so they're cached separately
+    cache_key = (url, user_agent, shorteners_only)
+    if use_cache:
+        with _CANONICAL_LINK_CACHE_LOCK:
+            if cache_key in _CANONICAL_LINK_CACHE:
+                _CANONICAL_LINK_CACHE.move_to_end(cache_key)
+                return _CANONICAL_LINK_CACHE[cache_key][1]
 
-    close_session = False
     if not session:
-        close_session = True
-        session = requests.Session()
-        session.headers.update({"User-Agent": user_agent})
-    if not url.startswith("http"):
-        url = "http://" + url
-    response = None
-    try:
-        with Timeout(timeout):
-            try:
-                response = session.head(url, allow_redirects=True, timeout=timeout)
-            except requests.ConnectionError:
-                try:
-                    response = session.head(url, allow_redirects=False, timeout=timeout)
-                except:
-                    pass
-    except:
-        pass
-
-    if response:
-
-        history = [(h.status_code, h.url) for h in response.history]
-        history.append((response.status_code, response.url))
-
-        last_good_url = history[0][1]
-        original_parsed = urlparse.urlparse(last_good_url)
-        has_path = original_parsed.path not in ["/", ""]
-        has_query = original_parsed.query != ""
-        prev_was_shortener = False
-        prev_path = None
-        prev_query = None
-        status_code = None
-        for i, resp in enumerate(history):
-            status_code, response_url = resp
-            if "errors/404" in response_url:
-                # If it's clearly a 404 landing page, stop and use the last observed good URL
-                break
-            parsed = urlparse.urlparse(response_url)
-            if (
-                parsed.netloc in VANITY_LINK_SHORTENERS.keys()
-                or parsed.netloc in GENERAL_LINK_SHORTENERS
-            ):
-                # Don't consider known shortened URLs
-                is_shortener = True
-            else:
-                is_shortener = False
-            if not is_shortener:
-                if i != 0:
-                    for param, val in urlparse.parse_qs(parsed.query).items():
-                        if len(val) == 1 and val[0].startswith("http"):
-                            parsed_possible_url = urlparse.urlparse(val[0])
-                            if (
-                                parsed_possible_url.scheme
-                                and parsed_possible_url.netloc
-                            ):
-                                # If the URL contains a GET parameter that is, itself, a URL, it's likely redirecting
-                                # to it, so we're going to stop this run and start the process over with the new URL
-                                return canonical_link(
-                                    val[0],
-                                    timeout=timeout,
-                                    session=session,
-                                    user_agent=user_agent,
-                                )
-                if status_code in PROXY_REQUIRED:
-                    # These codes tend to indicate the last good URL in the chain
-                    last_good_url = response_url
-                    break
-                good_path = not has_path or parsed.path not in ["/", ""]
-                good_query = not has_query or parsed.query != ""
-                # If the URL has a path or some GET parameters, we'll inspect further
-                # Otherwise we just go with the previous URL
-                # Link shorteners are very rarely used to reference root domains
-                if good_query or good_path:
-                    if (
-                        re.sub("https", "http", response_url)
-                        == re.sub("https", "http", last_good_url)
-                        or parsed.path == original_parsed.path
-                    ) or response_url.lower() == last_good_url.lower():
-                        # If it's the same link but only the domain, protocol, or casing changed, it's fine
-                        last_good_url = response_url
-                    elif i != 0 and status_code in CHECK_LENGTH:
-                        # For these codes, we're going to see how much the link changed
-                        # Redirects and 404s sometimes preserve a decent URL, sometimes they go to a landing page
-                        # The following cutoffs seem to do a good job most of the time:
-                        # 1) The new URL has a long domain more than 7 characters, so it's not likely a shortened URL
-                        # 2) The prior URL had a long path and this one has fewer than 20 characters and it wasn't
-                        # swapped out for GET params
-                        # 3) Or the prior URL had GET params and this one has far fewer and no replacement path
-                        # If these conditions are met and the path or query do not identically match the prior link
-                        # Then it's usually a generic error page
-                        bad = False
-                        if (
-                            has_path
-                            and len(parsed.netloc) > 7
-                            and len(parsed.path) < 20
-                            and len(parsed.query) == 0
-                            and prev_path != parsed.path
-                        ) or (
-                            has_query
-                            and len(parsed.netloc) > 7
-                            and len(parsed.query) < 20
-                            and len(parsed.path) <= 1
-                            and prev_query != parsed.query
-                        ):
-                            bad = True
-                        if not bad or prev_was_shortener:
-                            last_good_url = response_url
-                            # print("GOOD: {}, {}".format(status_code, response_url))
-                        else:
-                            # These can sometimes resolve further though, so we continue onward
-                            prev_path = None
-                            prev_query = None
-                    else:
-                        if status_code not in BAD_STATUS_CODES:
-                            last_good_url = response_url
-                        else:
-                            break
-                else:
-                    # Resolved to a general URL
-                    break
+        session = _get_default_session(user_agent)
+    embedded_redirects = 0
+    resolved = False
+    while True:
+        if not url.startswith("http"):
+            url = "http://" + url
+        if shorteners_only and _looks_canonical(url):
+            break
+        response = None
+        try:
+            # Connect and read timeouts are enforced by requests itself, which raises requests.Timeout
+            # With shorteners_only, a URL that needs no resolving is just as acceptable partway through the chain
+            response, history = _follow_redirects(
+                url, session, timeout, stop_at_canonical=shorteners_only
+            )
+        except:
+            pass
+        if not response:
+            break
 
-            prev_was_shortener = is_shortener
-            prev_path = parsed.path
-            prev_query = parsed.query
+        last_good_url, status_code, embedded_url = _pick_canonical_url(
+            history, follow_embedded=embedded_redirects < _MAX_EMBEDDED_REDIRECTS
+        )
+        if embedded_url:
+            # Start the process over with the URL that was embedded in the GET parameters
+            url = embedded_url
+            embedded_redirects += 1
+            continue
 
-        if status_code not in BAD_STATUS_CODES:
+        if status_code not in _BAD_STATUS_CODES:
             # If the URL ended on a good status code, we'll try to trim out any unnecessary GET parameters
             last_good_url = trim_get_parameters(
                 last_good_url, session=session, timeout=timeout, user_agent=user_agent
             )
-
         url = last_good_url
+        resolved = True
+        break
 
-    if close_session:
-        session.close()
+    if use_cache and resolved:
+        # We only cache successful resolutions, since failures are often transient
+        with _CANONICAL_LINK_CACHE_LOCK:
+            _CANONICAL_LINK_CACHE[cache_key] = (time.time(), url)
+            if len(_CANONICAL_LINK_CACHE) > _CANONICAL_LINK_CACHE_SIZE:
+                _CANONICAL_LINK_CACHE.popitem(last=False)
 
     return url
+
+
+def canonical_links(
+    urls,
+    timeout=5.0,
+    session=None,
+    user_agent=None,
+    use_cache=True,
+    max_workers=16,
+    shorteners_only=False,
+):
+
+    """
+    Resolves many links at once by running :py:func:`pewtils.http.canonical_link` concurrently. Resolving a link is \
+    almost entirely spent waiting on the network, so overlapping the requests scales nearly linearly with the \
+    number of workers, up to the limits of the servers involved.
+
+    :param urls: The URLs to resolve
+    :type urls: list
+    :param timeout: How long to wait for a response before giving up on each link
+    :type timeout: int or float
+    :param session: (Optional) A persistent session to share across all of the requests. If not provided, each \
+    link gets its own session (and cookies), though they all share a pool of connections.
+    :type session: :py:class:`requests.Session` object
+    :param user_agent: User agent for the auto-created requests Session to use, if a preconfigured requests Session \
+    is not provided
+    :type user_agent: str
+    :param use_cache: Whether to reuse the results of previous successful resolutions (default is True)
+    :type use_cache: bool
+    :param max_workers: The maximum number of links to resolve at the same time (default is 16)
+    :type max_workers: int
+    :param shorteners_only: If True, links that don't look like they need resolving are returned as-is without \
+    making any requests; see :py:func:`pewtils.http.canonical_link` (default is False)
+    :type shorteners_only: bool
+    :return: The "canonical" version of each URL, in the same order as the input
+    :rtype: list
+
+    Usage::
+
+        from pewtils.http import canonical_links
+
+        >>> canonical_links(["https://pewrsr.ch/2lxB0EX", "https://pewrsr.ch/2kk3VvY"])
+        ["https://www.pewresearch.org/interactives/how-does-a-computer-see-gender/",
+        "https://www.pewresearch.org/internet/2019/09/05/more-than-half-of-u-s-adults-trust-law-enforcement-to-use-facial-recognition-responsibly/"]
+
+    """
+
+    def _resolve(url):
+        return canonical_link(
+            url,
+            timeout=timeout,
+            session=session,
+            user_agent=user_agent,
+            use_cache=use_cache,
+            shorteners_only=shorteners_only,
+        )
+
+    # Duplicate links only need to be resolved once
+    unique_urls = list(OrderedDict.fromkeys(urls))
+    if not unique_urls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_urls))) as executor:
+        resolved = dict(zip(unique_urls, executor.map(_resolve, unique_urls)))
+
+    return [resolved[url] for url in urls]
+
+
+def clear_url_caches(max_age=None):
+
+    """
+    Empties the caches used by :py:func:`pewtils.http.hash_url`, :py:func:`pewtils.http.extract_domain_from_url`, \
+    :py:func:`pewtils.http.canonical_link`, :py:func:`pewtils.regex.extract_url` and \
+    :py:func:`pewtils.regex.extract_domain`. Useful for bounding memory in long-running processes, or if you \
+    need to re-resolve links that may have changed.
+
+    :param max_age: (Optional) If provided, only links that :py:func:`pewtils.http.canonical_link` resolved more \
+    than this many seconds ago are removed, so they'll be looked up again the next time. The other caches don't \
+    depend on the network and can't go stale, so they're left alone.
+    :type max_age: int or float
+
+    Usage::
+
+        from pewtils.http import clear_url_caches
+
+        >>> clear_url_caches()
+        >>> clear_url_caches(max_age=60 * 60 * 24)  # Re-resolve links that are more than a day old
+
+    """
+
+    if max_age is None:
+        hash_url.cache_clear()
+        _extract_domain.cache_clear()
+        extract_url.cache_clear()
+        extract_domain.cache_clear()
+        with _CANONICAL_LINK_CACHE_LOCK:
+            _CANONICAL_LINK_CACHE.clear()
+    else:
+        cutoff = time.time() - max_age
+        with _CANONICAL_LINK_CACHE_LOCK:
+            for cache_key, (resolved_at, _) in list(_CANONICAL_LINK_CACHE.items()):
+                if resolved_at < cutoff:
+                    del _CANONICAL_LINK_CACHE[cache_key]
@@ -1,22 +1,265 @@
 from builtins import object
-from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from functools import lru_cache, partial
+from io import BytesIO, TextIOWrapper
 from pewtils import is_not_null
-from scandir import scandir
-import boto3
+import asyncio
 import datetime
+import gzip
 import hashlib
 import json
+import mmap
 import os
 import pandas as pd
 import pickle as pickle
-import time
+import uuid
 
 try:
-    from io import StringIO, BytesIO
+    # orjson is considerably faster than the standard library for large JSON files, but isn't required
+    import orjson
+except ImportError:
+    orjson = None
 
+try:
+    # zstd compresses about as well as gzip at a fraction of the CPU cost, but isn't required
+    import zstandard
 except ImportError:
-    from StringIO import StringIO as BytesIO
-    from StringIO import StringIO
+    zstandard = None
+
+
+@lru_cache(maxsize=1)
+def _s3_transfer_config():
+
+    """
+    Returns the boto3 transfer settings for S3 uploads and downloads: anything over 8MB is split into 8MB parts \
+    that are transferred concurrently, and downloads are streamed in 1MB reads rather than the default 256KB. \
+    Built on first use, so :py:mod:`boto3` is only imported when S3 is.
+    """
+
+    import boto3.s3.transfer
+
+    return boto3.s3.transfer.TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=10,
+        use_threads=True,
+        io_chunksize=1024 * 1024,
+    )
+
+
+@lru_cache(maxsize=1)
+def _s3_client():
+
+    """
+    Returns the boto3 S3 client shared by every :py:class:`pewtils.io.FileHandler`. Clients are thread-safe and \
+    expensive to create, and sharing one keeps its connection pool warm. boto3 is slow to import, so it's only \
+    loaded when S3 is actually being used.
+    """
+
+    import boto3
+
+    return boto3.client("s3")
+
+
+# Formats that are read into and written from DataFrames
+_DATAFRAME_FORMATS = frozenset(["csv", "tab", "xls", "xlsx", "dta"])
+# Formats that are always read as bytes
+_BINARY_FORMATS = frozenset(["pkl", "xls", "xlsx", "dta"])
+# File suffixes for each of the compression options; Excel files are already compressed, and Stata files need to \
+# be written to a seekable file, so neither can be compressed
+_COMPRESSION_SUFFIXES = {"gzip": "gz", "zstd": "zst"}
+_UNCOMPRESSIBLE_FORMATS = frozenset(["xls", "xlsx", "dta"])
+
+
+def _json_dumps(data, **io_kwargs):
+
+    """
+    Serializes data to JSON for :py:meth:`pewtils.io.FileHandler.write`, using :py:mod:`orjson` when it's \
+    installed and no ``json.dumps`` options were passed.
+    """
+
+    if orjson and not io_kwargs:
+        try:
+            return orjson.dumps(
+                data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+        except TypeError:
+            # Fall back to the standard library for anything orjson doesn't support
+            pass
+    return json.dumps(data, **io_kwargs)
+
+
+def _json_loads(data):
+
+    """
+    Parses JSON for :py:meth:`pewtils.io.FileHandler.read`, using :py:mod:`orjson` when it's installed.
+    """
+
+    if orjson:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The standard library also accepts non-standard values like NaN
+            pass
+    return json.loads(data)
+
+
+def _unpickle(data):
+
+    """
+    Unpickles data (``bytes`` or any other buffer, like a memory-mapped file) for \
+    :py:meth:`pewtils.io.FileHandler.read`, returning None if it can't be loaded.
+    """
+
+    try:
+        return pickle.loads(data)
+
+    except TypeError:
+        return None
+
+    except Exception as e:
+        print("Couldn't load pickle!  {}".format(e))
+        return None
+
+
+# Types whose repr can't contain anything else, so a container holding only these can't refer back to itself
+_SCALAR_KEY_TYPES = frozenset([str, bytes, int, float, bool, type(None)])
+
+
+def _iter_key_chunks(key):
+
+    """
+    Yields the string representation of a key for :py:meth:`pewtils.io.FileHandler.get_key_hash` in pieces. Plain \
+    dicts, lists, and tuples of scalars (strings, numbers, etc.) are rendered one item at a time, so hashing a \
+    large one doesn't require building its entire string representation in memory; anything else, including \
+    nested (and possibly self-referencing) containers, is rendered with ``str`` all at once. Either way, the \
+    pieces add up to exactly ``str(key)``.
+    """
+
+    if type(key) is dict and all(
+        type(k) in _SCALAR_KEY_TYPES and type(v) in _SCALAR_KEY_TYPES
+        for k, v in key.items()
+    ):
+        yield "{"
+        for i, (k, v) in enumerate(key.items()):
+            yield "{}{!r}: {!r}".format(", " if i else "", k, v)
+        yield "}"
+    elif type(key) is list and all(type(v) in _SCALAR_KEY_TYPES for v in key):
+        yield "["
+        for i, v in enumerate(key):
+            yield "{}{!r}".format(", " if i else "", v)
+        yield "]"
+    elif (
+        type(key) is tuple
+        and len(key) != 1
+        and all(type(v) in _SCALAR_KEY_TYPES for v in key)
+    ):
+        yield "("
+        for i, v in enumerate(key):
+            yield "{}{!r}".format(", " if i else "", v)
+        yield ")"
+    else:
+        yield key if isinstance(key, str) else str(key)
+
+
+def _new_key_hasher(key_hash_function):
+
+    """
+    Returns a new hashlib object for :py:meth:`pewtils.io.FileHandler.get_key_hash`.
+    """
+
+    if key_hash_function == "sha224":
+        return hashlib.sha224()
+    elif key_hash_function == "blake2b":
+        # A 28-byte digest keeps hashed keys the same length as SHA224's
+        return hashlib.blake2b(digest_size=28)
+    else:
+        raise Exception("Unsupported key hash function: {}".format(key_hash_function))
+
+
+@lru_cache(maxsize=4096)
+def _get_cached_key_hash(key, key_hash_function):
+
+    """
+    Hashes a string key; cached, since the same keys tend to be read and written over and over.
+    """
+
+    hasher = _new_key_hasher(key_hash_function)
+    hasher.update(key.encode("utf8"))
+    return hasher.hexdigest()
+
+
+def _check_compression(compression, format):
+
+    """
+    Raises an exception if :py:class:`pewtils.io.FileHandler` can't use the requested compression for a format.
+    """
+
+    if compression not in _COMPRESSION_SUFFIXES:
+        raise Exception("Unsupported compression: {}".format(compression))
+    if compression == "zstd" and not zstandard:
+        raise Exception("zstd compression requires the zstandard package")
+    if format in _UNCOMPRESSIBLE_FORMATS:
+        raise Exception("'{}' files can't be compressed".format(format))
+
+
+@contextmanager
+def _compressing(output, compression):
+
+    """
+    Wraps a binary file object so that everything written to it is compressed, without closing the original \
+    file object when it's done.
+    """
+
+    if compression == "gzip":
+        with gzip.GzipFile(fileobj=output, mode="wb") as compressed:
+            yield compressed
+    elif compression == "zstd":
+        with zstandard.ZstdCompressor(level=3).stream_writer(
+            output, closefd=False
+        ) as compressed:
+            yield compressed
+    else:
+        yield output
+
+
+def _decompress(data, compression):
+
+    """
+    Decompresses the contents of a file written by :py:meth:`pewtils.io.FileHandler.write` with compression.
+    """
+
+    if compression == "gzip":
+        return gzip.decompress(data)
+    elif compression == "zstd":
+        # Streamed frames don't record their size, so they have to be decompressed incrementally
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+@contextmanager
+def _atomic_open(path, mode):
+
+    """
+    Opens a temporary file next to ``path`` and moves it into place once it's been written, so concurrent readers \
+    only ever see the old file or the complete new one. If writing fails, the temporary file is removed and \
+    ``path`` is left untouched. Each call gets its own temporary file, so concurrent writes to the same path (e.g. \
+    from threads) can't clobber each other's partial output; the last one to finish wins.
+    """
+
+    # A random suffix rather than tempfile.mkstemp, so the file gets the usual permissions instead of 0600
+    tmp_path = "{}.tmp.{}.{}".format(path, os.getpid(), uuid.uuid4().hex)
+    try:
+        with closing(open(tmp_path, mode)) as output:
+            yield output
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 class FileHandler(object):
@@ -31,6 +274,10 @@ class FileHandler(object):
     :param bucket: The name of the S3 bucket, required if ``use_s3=True``; will also try to fetch from the environment \
     as S3_BUCKET
     :type bucket: str
+    :param key_hash_function: The algorithm :py:meth:`pewtils.io.FileHandler.get_key_hash` uses to hash keys; \
+    options are ``'sha224'`` (default) and ``'blake2b'``. BLAKE2b is faster and produces hashes of the same length, \
+    but they're different hashes, so files written with one can't be found by hashed key with the other.
+    :type key_hash_function: str
 
     .. note:: Typical rectangular data files (i.e. ``csv``, ``tab``, ``xlsx``, ``xls``, ``dta`` file extension types) will be \
         read to/written from a :py:class:`pandas.DataFrame` object. The exceptions are `pkl` and `json` objects which \
@@ -59,13 +306,13 @@ class FileHandler(object):
         >>> h = FileHandler("/my_folder", use_s3=True, bucket="my-bucket")
     """
 
-    def __init__(self, path, use_s3=None, bucket=None):
+    def __init__(self, path, use_s3=None, bucket=None, key_hash_function="sha224"):
         self.bucket = os.environ.get("S3_BUCKET", None) if bucket is None else bucket
         self.path = path
+        self.key_hash_function = key_hash_function
         self.use_s3 = use_s3 if is_not_null(self.bucket) else False
         if self.use_s3:
-            s3_params = {}
-            self.s3 = boto3.client("s3")
+            self.s3 = _s3_client()
 
         else:
             self.path = os.path.join(self.path)
@@ -98,12 +345,16 @@ class FileHandler(object):
         """
 
         if self.use_s3:
-            for key in self.s3.list_objects(Bucket=self.bucket, Prefix=self.path)['Contents']:
-                yield key["Key"]
+            # Listings are paginated, 1000 keys at a time
+            paginator = self.s3.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self.path):
+                for key in page.get("Contents", []):
+                    yield key["Key"]
 
         else:
-            for f in scandir(self.path):
-                yield f.name
+            with os.scandir(self.path) as entries:
+                for f in entries:
+                    yield f.name
 
     def clear_folder(self):
         """
@@ -125,12 +376,29 @@ class FileHandler(object):
         """
 
         if self.use_s3:
-            for key in self.s3.list_objects(Bucket=self.bucket, Prefix=self.path)['Contents']:
-                self.s3.delete_object(Bucket=self.bucket, Prefix=key['Key'])
+
+            def _delete(keys):
+                self.s3.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": keys, "Quiet": True}
+                )
+
+            paginator = self.s3.get_paginator("list_objects_v2")
+            # Pages are deleted in the background while the next ones are listed
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = []
+                for page in paginator.paginate(Bucket=self.bucket, Prefix=self.path):
+                    # Each page has at most 1000 keys, which is also the most that can be deleted in one request
+                    keys = [{"Key": key["Key"]} for key in page.get("Contents", [])]
+                    if keys:
+                        futures.append(executor.submit(_delete, keys))
+                for future in futures:
+                    future.result()
 
         else:
-            for f in scandir(self.path):
-                os.unlink(os.path.join(self.path, f.name))
+            with os.scandir(self.path) as entries:
+                for f in entries:
+                    # The entry's path is already joined to the folder
+                    os.unlink(f.path)
 
     def clear_file(self, key, format="pkl", hash_key=False):
         """
@@ -184,7 +452,8 @@ class FileHandler(object):
 
         :param key: A raw string or Python object that can be meaningfully converted into a string representation
         :type key: str or object
-        :return: A SHA224 hash representation of that key
+        :return: A SHA224 (or, if the handler was created with ``key_hash_function="blake2b"``, a 224-bit BLAKE2b) \
+        hash representation of that key
         :rtype: str
 
         Usage::
@@ -199,13 +468,22 @@ class FileHandler(object):
 
         """
 
-        try:
-            return hashlib.sha224(key.encode("utf8")).hexdigest()
-        except AttributeError:
-            return hashlib.sha224(str(key).encode("utf8")).hexdigest()
+        if type(key) is str:
+            return _get_cached_key_hash(key, self.key_hash_function)
+        hasher = _new_key_hasher(self.key_hash_function)
+        for chunk in _iter_key_chunks(key):
+            hasher.update(chunk.encode("utf8"))
+        return hasher.hexdigest()
 
     def write(
-        self, key, data, format="pkl", hash_key=False, add_timestamp=False, **io_kwargs
+        self,
+        key,
+        data,
+        format="pkl",
+        hash_key=False,
+        add_timestamp=False,
+        compression=None,
+        **io_kwargs
     ):
 
         """
@@ -223,6 +501,10 @@ class FileHandler(object):
         :type hash_key: bool
         :param add_timestamp: Optionally add a timestamp to the filename
         :type add_timestamp: bool
+        :param compression: (Optional) Compress the file with ``'gzip'`` or ``'zstd'`` (requires \
+        :py:mod:`zstandard`). A ``.gz`` or ``.zst`` suffix is added to the file name, and you'll need to pass the \
+        same option to :py:meth:`pewtils.io.FileHandler.read`. Not available for ``xlsx``, ``xls``, or ``dta`` files.
+        :type compression: str
         :param io_kwargs: Additional parameters to pass along to the Pandas save function, if applicable
         :return: None
 
@@ -238,6 +520,15 @@ class FileHandler(object):
 
             If you're trying to save an object to JSON, it assumes that you're passing it valid JSON. By default, \
             the handler attempts to use pickling, allowing you to save anything you want, as long as it's serializable.
+            Pickles are written with the highest protocol your version of Python supports; pass ``protocol`` in \
+            ``io_kwargs`` if they need to be readable by older versions.
+
+        .. note:: Local files are written to a temporary file first and then moved into place, so anything reading \
+            the file at the same time will never see a partially-written version.
+
+        .. note:: If :py:mod:`orjson` is installed, it will be used to read and write JSON files, which is much \
+            faster for large objects. It writes compact JSON and saves NaN values as ``null``. If you pass any \
+            ``io_kwargs`` when saving JSON, they're forwarded to :py:func:`json.dumps` instead.
 
         """
 
@@ -249,58 +540,97 @@ class FileHandler(object):
         if add_timestamp:
             key = "{}_{}".format(key, datetime.datetime.now())
 
-        def _get_output(output, data, io_kwargs):
+        if compression:
+            _check_compression(compression, format)
+
+        def _write_frame(output, data, io_kwargs):
             if format == "tab":
                 io_kwargs["sep"] = "\t"
             if format in ["csv", "tab"]:
-                data.to_csv(output, encoding="utf8", **io_kwargs)
+                # pandas writes text, which is encoded into the binary output as it's written
+                text_output = TextIOWrapper(output, encoding="utf8", newline="")
+                data.to_csv(text_output, encoding="utf8", **io_kwargs)
+                text_output.detach()
             elif format == "dta":
                 data.to_stata(output, **io_kwargs)
             elif format in ["xls", "xlsx"]:
                 writer = pd.ExcelWriter(output, engine="xlsxwriter")
                 data.to_excel(writer, **io_kwargs)
                 writer.save()
-            data = output.getvalue()
-            return data
 
-        if format in ["csv", "xls", "xlsx", "tab", "dta"]:
-            try:
-                data = _get_output(BytesIO(), data, io_kwargs)
-            except Exception as e:
+        key += ".{}".format(format)
+        if compression:
+            key += ".{}".format(_COMPRESSION_SUFFIXES[compression])
+        filepath = "/".join([self.path, key])
+        path = os.path.join(self.path, key)
+
+        if format in _DATAFRAME_FORMATS:
+            # DataFrames are written straight to their destination, rather than being rendered into one big string \
+            # first and then copied into the file or upload
+            if self.use_s3:
+                output = BytesIO()
                 try:
-                    data = _get_output(StringIO(), data, io_kwargs)
-                except:
+                    with _compressing(output, compression) as compressed:
+                        _write_frame(compressed, data, io_kwargs)
+                except Exception:
                     raise Exception(
                         "Couldn't convert data into '{}' format".format(format)
                     )
+                output.seek(0)
+                self.s3.upload_fileobj(
+                    output, Bucket=self.bucket, Key=filepath, Config=_s3_transfer_config()
+                )
+
+            elif os.path.exists(self.path):
+                try:
+                    with _atomic_open(path, "wb") as output:
+                        with _compressing(output, compression) as compressed:
+                            _write_frame(compressed, data, io_kwargs)
+                except Exception:
+                    raise Exception(
+                        "Couldn't convert data into '{}' format".format(format)
+                    )
+            return
 
         elif format == "pkl":
+            # Protocol 5 (Python 3.8+) serializes large buffers like numpy arrays without an intermediate copy
+            io_kwargs.setdefault("protocol", pickle.HIGHEST_PROTOCOL)
+            if not self.use_s3:
+                if os.path.exists(self.path):
+                    # Pickling straight into the file avoids holding the whole serialized object in memory
+                    with _atomic_open(path, "wb") as output:
+                        with _compressing(output, compression) as compressed:
+                            pickle.dump(data, compressed, **io_kwargs)
+                return
             data = pickle.dumps(data, **io_kwargs)
         elif format == "json":
-            data = json.dumps(data, **io_kwargs)
-
-        key += ".{}".format(format)
+            data = _json_dumps(data, **io_kwargs)
+
+        if compression:
+            output = BytesIO()
+            with _compressing(output, compression) as compressed:
+                compressed.write(
+                    data if isinstance(data, (bytes, bytearray)) else data.encode("utf8")
+                )
+            data = output.getvalue()
 
         if self.use_s3:
-            try:
-                upload = BytesIO(data)
+            upload = BytesIO(
+                data if isinstance(data, (bytes, bytearray)) else data.encode("utf8")
+            )
 
-            except TypeError:
-                upload = BytesIO(data.encode())
-
-            self.s3.upload_fileobj(upload, Bucket=self.bucket, Key="/".join([self.path, key]))
+            self.s3.upload_fileobj(
+                upload, Bucket=self.bucket, Key=filepath, Config=_s3_transfer_config()
+            )
 
         else:
-            path = os.path.join(self.path, key)
             if os.path.exists(self.path):
-                try:
-                    with closing(open(path, "w")) as output:
-                        output.write(data)
-                except:
-                    with closing(open(path, "wb")) as output:
-                        output.write(data)
+                # Pickles (and JSON from orjson) are bytes, everything else is text
+                mode = "wb" if isinstance(data, (bytes, bytearray)) else "w"
+                with _atomic_open(path, mode) as output:
+                    output.write(data)
 
-    def read(self, key, format="pkl", hash_key=False, **io_kwargs):
+    def read(self, key, format="pkl", hash_key=False, compression=None, **io_kwargs):
 
         """
         Reads a file from the directory or S3 path, returning its contents.
@@ -311,6 +641,9 @@ class FileHandler(object):
         :type format: str
         :param hash_key: Whether the key should be hashed prior to looking for and retrieving the file.
         :type hash_key: bool
+        :param compression: (Optional) If the file was written with compression, the same option that was passed \
+        to :py:meth:`pewtils.io.FileHandler.write` (``'gzip'`` or ``'zstd'``)
+        :type compression: str
         :param io_kwargs: Optional arguments to be passed to the specific load function (dependent on file format)
         :return: The file contents, in the requested format
 
@@ -322,6 +655,14 @@ class FileHandler(object):
             - `tab`: :py:meth:`pandas.DataFrame.read_csv`
             - `xlsx`: :py:meth:`pandas.DataFrame.read_excel`
             - `xls`: :py:meth:`pandas.DataFrame.read_excel`
+
+        .. tip:: For files that are too large to load at once, pass ``chunksize`` (or ``iterator=True``) when reading \
+            a ``csv``, ``tab``, or local ``dta`` file. The file is then streamed straight into pandas rather than \
+            being loaded into memory first, and you'll get back a reader that yields DataFrames.
+
+        .. tip:: With pandas 1.4+ and :py:mod:`pyarrow` installed, you can pass ``engine="pyarrow"`` when reading a \
+            ``csv`` or ``tab`` file to parse it on multiple threads, which is much faster for large files. \
+            It can't be combined with ``chunksize``.
         """
 
         format = format.strip(".")
@@ -331,97 +672,234 @@ class FileHandler(object):
 
         data = None
         filepath = "/".join([self.path, "{}.{}".format(key, format)])
+        if compression:
+            _check_compression(compression, format)
+            filepath += ".{}".format(_COMPRESSION_SUFFIXES[compression])
 
-        if self.use_s3:
-            try:
-                data = StringIO()
-
-            except TypeError:
-                data = BytesIO()
+        if io_kwargs.get("chunksize") or io_kwargs.get("iterator"):
+            # Hand pandas the file (or S3 stream) itself, so it only ever holds one chunk in memory
+            if format in ["csv", "tab"]:
+                if format == "tab":
+                    io_kwargs["delimiter"] = "\t"
+                if compression:
+                    io_kwargs["compression"] = compression
+                if self.use_s3:
+                    body = self.s3.get_object(Bucket=self.bucket, Key=filepath)["Body"]
+                    return pd.read_csv(body, **io_kwargs)
+                elif os.path.exists(filepath):
+                    return pd.read_csv(filepath, **io_kwargs)
+                return None
+            elif format == "dta" and not self.use_s3:
+                # Stata files need to be seekable, so this only works locally
+                if os.path.exists(filepath):
+                    return pd.read_stata(filepath, **io_kwargs)
+                return None
 
-            self.s3.download_fileobj(data, Bucket=self.bucket, Key=filepath)
+        if self.use_s3:
+            # boto3's transfer manager downloads large objects in parallel chunks
+            data = BytesIO()
+            self.s3.download_fileobj(
+                Bucket=self.bucket, Key=filepath, Fileobj=data, Config=_s3_transfer_config()
+            )
             data = data.getvalue()
         else:
             if os.path.exists(filepath):
-                try:
-                    with closing(open(filepath, "r")) as infile:
-                        data = infile.read()
-
-                except:
-                    # TODO: handle this exception more explicitly
+                if format == "pkl" and not compression:
+                    # Unpickle straight from a memory-mapped file, so the OS pages it in as it's read, instead of
+                    # copying the whole thing into memory first
+                    with closing(open(filepath, "rb")) as infile:
+                        if os.fstat(infile.fileno()).st_size == 0:
+                            return None
+                        with closing(
+                            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                        ) as mapped:
+                            return _unpickle(mapped)
+                elif format in ["csv", "tab"]:
+                    # Let pandas memory-map the file itself (the pyarrow engine doesn't support this)
+                    if format == "tab":
+                        io_kwargs["delimiter"] = "\t"
+                    if compression:
+                        io_kwargs["compression"] = compression
+                    elif io_kwargs.get("engine") != "pyarrow":
+                        io_kwargs.setdefault("memory_map", True)
+                    return pd.read_csv(filepath, **io_kwargs)
+                elif format in _BINARY_FORMATS or compression:
                     with closing(open(filepath, "rb")) as infile:
                         data = infile.read()
+                else:
+                    try:
+                        with closing(open(filepath, "r")) as infile:
+                            data = infile.read()
 
-        if is_not_null(data):
-            if format == "pkl":
-                try:
-                    data = pickle.loads(data)
-
-                except TypeError:
-                    data = None
-
-                except ValueError:
-                    if "attempt_count" not in io_kwargs:
-                        io_kwargs["attempt_count"] = 1
-
-                    print(
-                        "Insecure pickle string; probably a concurrent read-write, \
-                        will try again in 5 seconds (attempt #{})".format(
-                            io_kwargs["attempt_count"]
-                        )
-                    )
-                    time.sleep(5)
+                    except UnicodeDecodeError:
+                        with closing(open(filepath, "rb")) as infile:
+                            data = infile.read()
 
-                    if io_kwargs["attempt_count"] <= 3:
-                        io_kwargs["attempt_count"] += 1
-                        data = self.read(
-                            key, format=format, hash_key=hash_key, **io_kwargs
-                        )
+        if compression and data:
+            data = _decompress(data, compression)
 
-                    else:
-                        data = None
-
-                except Exception as e:
-                    print("Couldn't load pickle!  {}".format(e))
-                    data = None
+        if is_not_null(data):
+            if format == "pkl":
+                data = _unpickle(data)
 
             elif format in ["tab", "csv"]:
                 if format == "tab":
                     io_kwargs["delimiter"] = "\t"
 
-                try:
-                    data = pd.read_csv(BytesIO(data), **io_kwargs)
-
-                except:
-                    data = pd.read_csv(StringIO(data), **io_kwargs)
+                data = pd.read_csv(BytesIO(data), **io_kwargs)
 
             elif format in ["xlsx", "xls"]:
                 # https://stackoverflow.com/questions/64264563/attributeerror-elementtree-object-has-no-attribute-getiterator-when-trying
                 if "engine" not in io_kwargs:
                     io_kwargs["engine"] = "openpyxl"
 
-                try:
-                    data = pd.read_excel(BytesIO(data), **io_kwargs)
-
-                except:
-                    data = pd.read_excel(StringIO(data), **io_kwargs)
+                data = pd.read_excel(BytesIO(data), **io_kwargs)
 
             elif format == "json":
                 try:
-                    data = json.loads(data)
+                    data = _json_loads(data)
 
                 except:
                     pass
 
             elif format == "dta":
-                try:
-                    data = pd.read_stata(BytesIO(data), **io_kwargs)
-
-                except:
-                    data = pd.read_stata(StringIO(data), **io_kwargs)
+                data = pd.read_stata(BytesIO(data), **io_kwargs)
 
             elif format == "txt":
                 if isinstance(data, bytes):
                     data = data.decode()
 
         return data
+
+    def write_many(self, data, format="pkl", hash_key=False, max_workers=8, **io_kwargs):
+
+        """
+        Writes many files at once by running :py:meth:`pewtils.io.FileHandler.write` concurrently. Useful for S3, \
+        where each write is mostly spent waiting on the network.
+
+        :param data: A dictionary mapping each key (without a file suffix!) to the data to write to it
+        :type data: dict
+        :param format: The format the data should be saved in; see :py:meth:`pewtils.io.FileHandler.write`
+        :type format: str
+        :param hash_key: Whether or not to hash the provided keys before saving the files. (Default=False)
+        :type hash_key: bool
+        :param max_workers: The maximum number of files to write at the same time (default is 8)
+        :type max_workers: int
+        :param io_kwargs: Additional parameters to pass along to :py:meth:`pewtils.io.FileHandler.write`
+        :return: None
+
+        Usage::
+
+            from pewtils.io import FileHandler
+
+            >>> h = FileHandler("./", use_s3=False)
+            >>> h.write_many({"file1": [1, 2, 3], "file2": {"key": "value"}}, format="json")
+
+        """
+
+        def _write(key):
+            self.write(key, data[key], format=format, hash_key=hash_key, **io_kwargs)
+
+        if data:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(data))) as executor:
+                list(executor.map(_write, data))
+
+    def read_many(self, keys, format="pkl", hash_key=False, max_workers=8, **io_kwargs):
+
+        """
+        Reads many files at once by running :py:meth:`pewtils.io.FileHandler.read` concurrently. Useful for S3, \
+        where each read is mostly spent waiting on the network.
+
+        :param keys: The names of the files to read (without suffixes!)
+        :type keys: list
+        :param format: The format of the files; see :py:meth:`pewtils.io.FileHandler.read`
+        :type format: str
+        :param hash_key: Whether the keys should be hashed prior to looking for and retrieving the files.
+        :type hash_key: bool
+        :param max_workers: The maximum number of files to read at the same time (default is 8)
+        :type max_workers: int
+        :param io_kwargs: Optional arguments to be passed to :py:meth:`pewtils.io.FileHandler.read`
+        :return: The contents of each file, in the same order as the keys
+        :rtype: list
+
+        Usage::
+
+            from pewtils.io import FileHandler
+
+            >>> h = FileHandler("./", use_s3=False)
+            >>> h.read_many(["file1", "file2"], format="json")
+            [[1, 2, 3], {"key": "value"}]
+
+        """
+
+        def _read(key):
+            return self.read(key, format=format, hash_key=hash_key, **io_kwargs)
+
+        keys = list(keys)
+        if not keys:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+            return list(executor.map(_read, keys))
+
+    async def awrite(
+        self, key, data, format="pkl", hash_key=False, add_timestamp=False, **io_kwargs
+    ):
+
+        """
+        An ``asyncio`` version of :py:meth:`pewtils.io.FileHandler.write`, which runs the write in the event loop's \
+        default thread pool so it doesn't block other coroutines. Takes the same arguments.
+
+        :return: None
+
+        Usage::
+
+            import asyncio
+            from pewtils.io import FileHandler
+
+            >>> h = FileHandler("./", use_s3=False)
+            >>> async def save(h): await h.awrite("my_data", {"key": "value"}, format="json")
+            >>> asyncio.run(save(h))
+
+        """
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            partial(
+                self.write,
+                key,
+                data,
+                format=format,
+                hash_key=hash_key,
+                add_timestamp=add_timestamp,
+                **io_kwargs
+            ),
+        )
+
+    async def aread(self, key, format="pkl", hash_key=False, **io_kwargs):
+
+        """
+        An ``asyncio`` version of :py:meth:`pewtils.io.FileHandler.read`, which runs the read in the event loop's \
+        default thread pool so it doesn't block other coroutines. Takes the same arguments.
+
+        :return: The file contents, in the requested format
+
+        Usage::
+
+            import asyncio
+            from pewtils.io import FileHandler
+
+            >>> h = FileHandler("./", use_s3=False)
+            >>> async def load(h, keys): return await asyncio.gather(*[h.aread(k, format="json") for k in keys])
+            >>> asyncio.run(load(h, ["file1", "file2"]))
+            [[1, 2, 3], {"key": "value"}]
+
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            partial(
+                self.read, key, format=format, hash_key=hash_key, **io_kwargs
+            ),
+        )
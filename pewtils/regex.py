@@ -1,3 +1,4 @@
+from functools import lru_cache
 import re
 
 
@@ -42,3 +43,91 @@ NONALPHA_REGEX = re.compile(r"[^\w]")
 """
 A compiled regular expression for finding non-alphanumeric values.
 """
+
+TOKEN_REGEX = re.compile(
+    r"(?P<url>{})|(?P<dollar>{})|(?P<number>{})|(?P<titleword>{})".format(
+        URL_REGEX.pattern,
+        US_DOLLAR_REGEX.pattern,
+        NUMBER_REGEX.pattern,
+        TITLEWORD_REGEX.pattern,
+    )
+)
+"""
+A compiled regular expression that combines :py:data:`URL_REGEX`, :py:data:`US_DOLLAR_REGEX`, \
+:py:data:`NUMBER_REGEX`, and :py:data:`TITLEWORD_REGEX` into a single pattern, so text only has to be scanned \
+once. Where they overlap, the earlier pattern wins (i.e. a number inside of a URL is only returned as part of the \
+URL). See :py:func:`pewtils.regex.iter_tokens`.
+"""
+
+
+def iter_tokens(text):
+
+    """
+    Scans text once for URLs, US dollar amounts, numbers, and title-cased words, yielding each match along with \
+    the type of token it is, in the order they appear.
+
+    :param text: The text to scan
+    :type text: str
+    :return: A generator of (token type, token) tuples, where the token type is one of ``url``, ``dollar``, \
+    ``number``, or ``titleword``
+    :rtype: generator
+
+    Usage::
+
+        from pewtils.regex import iter_tokens
+
+        >>> list(iter_tokens("Visit example.com to donate $5"))
+        [('titleword', 'Visit'), ('url', 'example.com'), ('dollar', '$5')]
+    """
+
+    for match in TOKEN_REGEX.finditer(text):
+        yield match.lastgroup, match.group(match.lastgroup)
+
+
+@lru_cache(maxsize=100000)
+def extract_url(text):
+
+    """
+    Returns the first (probably) valid URL found in a string, using :py:data:`URL_REGEX`. Results are cached, so \
+    repeatedly extracting URLs from the same strings is cheap.
+
+    :param text: The text to search
+    :type text: str
+    :return: The first URL in the text, or None if there isn't one
+    :rtype: str
+
+    Usage::
+
+        from pewtils.regex import extract_url
+
+        >>> extract_url("Read more at https://www.example.com/test today")
+        'https://www.example.com/test'
+    """
+
+    match = URL_REGEX.search(text)
+    return match.group(1) if match else None
+
+
+@lru_cache(maxsize=100000)
+def extract_domain(text):
+
+    """
+    Returns the domain of a URL, using :py:data:`DOMAIN_REGEX`. Results are cached, so repeatedly extracting \
+    domains from the same URLs is cheap. Like the regex itself, this can be useful in a pinch but we recommend \
+    using :py:func:`pewtils.http.extract_domain_from_url` instead.
+
+    :param text: The URL to extract the domain from
+    :type text: str
+    :return: The domain, or None if one couldn't be found
+    :rtype: str
+
+    Usage::
+
+        from pewtils.regex import extract_domain
+
+        >>> extract_domain("https://www.test.example.com/test")
+        'test.example.com'
+    """
+
+    match = DOMAIN_REGEX.search(text)
+    return match.group(1) if match else None
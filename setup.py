@@ -1,11 +1,13 @@
-from setuptools import setup, find_packages
+from pathlib import Path
+from setuptools import setup
 
-with open("README.md") as README:
-    readme = str(README.read())
+readme = Path("README.md").read_text(encoding="utf-8")
 
-with open("requirements.txt") as reqs:
-    lines = reqs.read().split("\n")
-    install_requires = [line for line in lines if line]
+install_requires = [
+    line.strip()
+    for line in Path("requirements.txt").read_text(encoding="utf-8").splitlines()
+    if line.strip()
+]
 
 setup(
     name="pewtils",
@@ -17,7 +19,7 @@ setup(
     author="Pew Research Center",
     author_email="info@pewresearch.org",
     install_requires=install_requires,
-    packages=find_packages(exclude=["contrib", "docs", "tests"]),
+    packages=["pewtils"],
     include_package_data=True,
     keywords="utilities, link standardization, input, output",
     license="GPLv2+",
@@ -1,4 +1,35 @@
+import datetime
+import hashlib
+import time
 import unittest
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from pewtils import (
+    PrintExecutionTime,
+    _NULL_VALUES,
+    _get_cached_hash,
+    cached_series_mapper,
+    chunk_list,
+    concat_text,
+    decode_text,
+    extract_attributes_from_folder_modules,
+    extract_json_from_folder,
+    flatten_list,
+    get_hash,
+    is_not_null,
+    is_null,
+    multiprocess_group_apply,
+    new_random_number,
+    recursive_update,
+    scale_range,
+    scan_dictionary,
+    timeout_wrapper,
+    vector_concat_text,
+    zipcode_num_to_string,
+)
 
 
 class BaseTests(unittest.TestCase):
@@ -8,6 +39,10 @@ class BaseTests(unittest.TestCase):
     To assess unit test coverage, run `coverage run -m unittest tests` and then `coverage report -m`.
     """
 
+    @classmethod
+    def setUpClass(cls):
+        cls.test_df = pd.DataFrame({"test": [1, 2, 3, 3], "group": [1, 1, 2, 2]})
+
     def setUp(self):
         pass
 
@@ -19,10 +54,6 @@ class BaseTests(unittest.TestCase):
             def __repr__(self):
                 return "repr"
 
-        import datetime
-        import numpy as np
-        from pewtils import decode_text
-
         text = decode_text("one two three")
         self.assertEqual(text, "one two three")
         # below examples taken from unidecode documentation
@@ -45,13 +76,9 @@ class BaseTests(unittest.TestCase):
         self.assertEqual(text, "str")
 
     def test_is_null(self):
-
-        import numpy as np
-        import pandas as pd
-        from pewtils import is_null, is_not_null
-
-        for val in [None, "None", "nan", "", " ", "NaN", "none", "n/a", "NONE", "N/A"]:
-            self.assertTrue(is_null(val))
+        self.assertEqual(
+            [is_null(val) for val in _NULL_VALUES], [True] * len(_NULL_VALUES)
+        )
         self.assertTrue(is_null(np.nan))
         self.assertTrue(is_not_null(0.0))
         self.assertTrue(is_null("-9", custom_nulls=["-9"]))
@@ -63,8 +90,6 @@ class BaseTests(unittest.TestCase):
         self.assertFalse(is_null(pd.DataFrame(), empty_lists_are_null=False))
 
     def test_recursive_update(self):
-        from pewtils import recursive_update
-
         class TestObject(object):
             def __init__(self, val):
                 self.val = val
@@ -90,16 +115,12 @@ class BaseTests(unittest.TestCase):
         self.assertEqual(result["level1"]["val3"]["test"], "test")
 
     def test_chunk_list(self):
-        from pewtils import chunk_list
-
         test = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-        chunked = [c for c in chunk_list(test, 3)]
+        chunked = list(chunk_list(test, 3))
         self.assertEqual(len(chunked), 4)
         self.assertEqual(chunked[-1], [10])
 
     def test_extract_json_from_folder(self):
-        from pewtils import extract_json_from_folder
-
         results = extract_json_from_folder(
             "tests/files", include_subdirs=False, concat_subdir_names=False
         )
@@ -119,8 +140,6 @@ class BaseTests(unittest.TestCase):
         )
 
     def test_extract_attributes_from_folder_modules(self):
-        from pewtils import extract_attributes_from_folder_modules
-
         results = extract_attributes_from_folder_modules("tests/files", "test")
         self.assertEqual(results["py"](), "test1")
         results = extract_attributes_from_folder_modules(
@@ -135,25 +154,18 @@ class BaseTests(unittest.TestCase):
         self.assertEqual(results["subfolder_subfolder_py"](), "test2")
 
     def test_zipcode_num_to_string(self):
-
-        from pewtils import zipcode_num_to_string
-
         for val in [20002, 20002.0, "20002", "20002.0"]:
-            zip = zipcode_num_to_string(val)
-            self.assertEqual(zip, "20002")
+            with self.subTest(val=val):
+                self.assertEqual(zipcode_num_to_string(val), "20002")
         for val in ["abcde", "12", "99999", "200", "1.0", None]:
-            zip = zipcode_num_to_string(val)
-            self.assertIsNone(zip)
+            with self.subTest(val=val):
+                self.assertIsNone(zipcode_num_to_string(val))
 
     def test_flatten_list(self):
-        from pewtils import flatten_list
-
         results = flatten_list([[1, 2, 3], [4, 5, 6]])
         self.assertEqual(results, [1, 2, 3, 4, 5, 6])
 
     def test_get_hash(self):
-        from pewtils import get_hash
-
         for text, method, expected_value in [
             (
                 "test_string",
@@ -170,44 +182,52 @@ class BaseTests(unittest.TestCase):
             (u"\u5317\u4EB0", "md5", "3261ad50fccf7ced43d944bbfd2acb5c"),
             (u"\u5317\u4EB0", "ssdeep", "3:I2n:l"),
         ]:
-            hash = get_hash(text, hash_function=method)
-            self.assertEqual(hash, expected_value)
+            with self.subTest(text=text, method=method):
+                self.assertEqual(get_hash(text, hash_function=method), expected_value)
 
-    def test_concat_text(self):
-        from pewtils import concat_text
+        hits = _get_cached_hash.cache_info().hits
+        self.assertEqual(
+            get_hash("test_string", hash_function="md5"),
+            "3474851a3410906697ec77337df7aae4",
+        )
+        self.assertGreater(_get_cached_hash.cache_info().hits, hits)
 
+        # Long texts are hashed directly rather than cached
+        long_text = "test_string" * 100
+        currsize = _get_cached_hash.cache_info().currsize
+        self.assertEqual(
+            get_hash(long_text, hash_function="md5"),
+            hashlib.md5(long_text.encode("utf8")).hexdigest(),
+        )
+        self.assertEqual(_get_cached_hash.cache_info().currsize, currsize)
+
+    def test_concat_text(self):
         result = concat_text(
             "one two three", u"ko\u017eu\u0161\u010dek", u"\u5317\u4EB0", None
         )
         self.assertEqual(result, "one two three kozuscek Bei Jing ")
 
     def test_vector_concat_text(self):
-        from pewtils import vector_concat_text
-
         result = vector_concat_text(["one", "two", "three"], ["a", "b", "c"])
         self.assertEqual(result[0], "one a")
         self.assertEqual(result[1], "two b")
         self.assertEqual(result[2], "three c")
 
     def test_cached_series_mapper(self):
-        import pandas as pd
-        from pewtils import cached_series_mapper
-
-        df = pd.DataFrame([{"test": 1}, {"test": 2}, {"test": 3}, {"test": 3}])
+        df = self.test_df.copy()
         df["mapped"] = cached_series_mapper(df["test"], lambda x: str(float(x)))
         self.assertEqual(list(df["mapped"].values), ["1.0", "2.0", "3.0", "3.0"])
 
     def test_multiprocess_group_apply(self):
-
-        import pandas as pd
-        from pewtils import multiprocess_group_apply
-
-        df = pd.DataFrame([{"test": 1}, {"test": 2}, {"test": 3}, {"test": 3}])
-        df["group"] = [1, 1, 2, 2]
+        df = self.test_df
 
         for add, multiply, expected in [(1, 2, 6), (1, 3, 9), (2, 2, 8)]:
             result = multiprocess_group_apply(
-                df.groupby("group"), _test_function_agg, add, multiply=multiply
+                df.groupby("group"),
+                _test_function_agg,
+                add,
+                workers=1,
+                multiply=multiply,
             )
             self.assertEqual(len(result), 2)
             self.assertEqual((result == expected).astype(int).sum(), 2)
@@ -219,20 +239,31 @@ class BaseTests(unittest.TestCase):
         ]:
 
             result = multiprocess_group_apply(
-                df.groupby("group"), _test_function_map, add, multiply=multiply
+                df.groupby("group"),
+                _test_function_map,
+                add,
+                workers=1,
+                multiply=multiply,
             )
             self.assertEqual(len(result), 4)
             self.assertEqual(list(result.values), expected)
 
-    def test_scale_range(self):
-        from pewtils import scale_range
+    def test_multiprocess_group_apply_pool(self):
+        df = self.test_df
+        result = multiprocess_group_apply(
+            df.groupby("group"), _test_function_agg, 1, workers=2, multiply=2
+        )
+        self.assertEqual(list(result.values), [6, 6])
+        result = multiprocess_group_apply(
+            df.groupby("group"), _test_function_map, 1, workers=2, multiply=2
+        )
+        self.assertEqual(list(result.values), [4, 6, 8, 8])
 
+    def test_scale_range(self):
         self.assertEqual(scale_range(10, 5, 25, 0, 10), 2.5)
         self.assertEqual(scale_range(5, 0, 10, 0, 20), 10.0)
 
     def test_scan_dictionary(self):
-        from pewtils import scan_dictionary
-
         test_dict = {"one": {"two": {"three": "woot"}}}
         vals, paths = scan_dictionary(test_dict, "three")
         self.assertEqual(vals[0], "woot")
@@ -259,9 +290,8 @@ class BaseTests(unittest.TestCase):
         self.assertIn("one/six/three/", paths)
 
     def test_new_random_number(self):
-        from pewtils import new_random_number
-        import numpy as np
-
+        # 100 draws keep the averages several standard deviations clear of the thresholds; seeding makes it repeatable
+        np.random.seed(0)
         for attempt, minimum, maximum, avg in [
             (1, 1, 2, 1),
             (1, 1, 10, 1),
@@ -275,43 +305,34 @@ class BaseTests(unittest.TestCase):
             (3, 2, 10, 5),
             (4, 2, 10, 5),
             (5, 2, 10, 5),
+            (5000, 2, 10, 5),
         ]:
-            attempts = [
-                new_random_number(attempt=attempt, minimum=minimum, maximum=maximum)
-                for i in range(500)
-            ]
+            attempts = new_random_number(
+                attempt=attempt, minimum=minimum, maximum=maximum, size=100
+            )
             self.assertGreaterEqual(np.min(attempts), minimum)
             self.assertLessEqual(np.max(attempts), maximum)
             self.assertGreaterEqual(round(np.average(attempts)), avg)
+        self.assertIsInstance(new_random_number(attempt=2), float)
 
     def test_timeout_wrapper(self):
-        from pewtils import timeout_wrapper
-        import time
-
         def test(sleep):
             try:
-                with timeout_wrapper(2):
+                with timeout_wrapper(1):
                     time.sleep(sleep)
                 return True
             except:
                 return False
 
-        self.assertFalse(test(3))
-        self.assertTrue(test(1))
+        self.assertFalse(test(2))
+        self.assertTrue(test(0.2))
 
     def test_print_execution_time(self):
-
-        import re
-        import time
-        from io import StringIO
-        from pewtils import PrintExecutionTime
-
         temp = StringIO()
-        with PrintExecutionTime(label="my function", stdout=temp):
-            time.sleep(5)
-        temp.seek(0)
-        output = temp.getvalue()
-        self.assertIsNotNone(re.match(r"my function: 5\.[0-9]+ seconds", output))
+        clock = iter([0.0, 5.25]).__next__
+        with PrintExecutionTime(label="my function", stdout=temp, clock=clock):
+            pass
+        self.assertEqual(temp.getvalue(), "my function: 5.25 seconds")
 
     def tearDown(self):
         pass
@@ -1,5 +1,18 @@
 import unittest
 
+from pewtils.regex import (
+    DOMAIN_REGEX,
+    HTTP_REGEX,
+    NONALPHA_REGEX,
+    NUMBER_REGEX,
+    TITLEWORD_REGEX,
+    URL_REGEX,
+    US_DOLLAR_REGEX,
+    extract_domain,
+    extract_url,
+    iter_tokens,
+)
+
 
 class RegexTests(unittest.TestCase):
 
@@ -11,10 +24,7 @@ class RegexTests(unittest.TestCase):
         pass
 
     def test_url_regex(self):
-
-        from pewtils.regex import URL_REGEX
-
-        for val in [
+        vals = [
             "example.com",
             "www.example.com",
             "http://example.com",
@@ -24,13 +34,12 @@ class RegexTests(unittest.TestCase):
             "example.com/test?test=test",
             "http://example.com?test=test&test=test",
             "https://t.co/example",
-        ]:
-            result = URL_REGEX.findall("test {} test".format(val))
-            self.assertEqual(result[0], val)
+        ]
+        # One pass over all of the samples; each line should yield exactly its own URL
+        corpus = "\n".join("test {} test".format(val) for val in vals)
+        self.assertEqual(URL_REGEX.findall(corpus), vals)
 
     def test_domain_regex(self):
-        from pewtils.regex import DOMAIN_REGEX
-
         for val in ["example.com", "http://example.com"]:
             result = DOMAIN_REGEX.findall(val)
             self.assertEqual(result[0], "example.com")
@@ -43,9 +52,19 @@ class RegexTests(unittest.TestCase):
             result = DOMAIN_REGEX.findall(val)
             self.assertEqual(result[0], "test.example.com")
 
-    def test_http_regex(self):
+    def test_extract_url_and_domain(self):
+        self.assertEqual(
+            extract_url("test https://www.example.com/test?test=test test"),
+            "https://www.example.com/test?test=test",
+        )
+        self.assertIsNone(extract_url("test test"))
+        self.assertEqual(
+            extract_domain("https://www.test.example.com/test"), "test.example.com"
+        )
+        extract_domain("https://www.test.example.com/test")
+        self.assertGreater(extract_domain.cache_info().hits, 0)
 
-        from pewtils.regex import HTTP_REGEX
+    def test_http_regex(self):
 
         for val in [
             "http://example.com",
@@ -66,8 +85,6 @@ class RegexTests(unittest.TestCase):
             self.assertIsNone(result)
 
     def test_us_dollar_regex(self):
-        from pewtils.regex import US_DOLLAR_REGEX
-
         for val in [
             "$1.00",
             "$10",
@@ -84,8 +101,6 @@ class RegexTests(unittest.TestCase):
             self.assertEqual(len(result), 0)
 
     def test_titleword_regex(self):
-        from pewtils.regex import TITLEWORD_REGEX
-
         for val, expected in [
             ("this is a Test", ["Test"]),
             ("testing One two three", ["One"]),
@@ -97,8 +112,6 @@ class RegexTests(unittest.TestCase):
             self.assertEqual(result, expected)
 
     def test_number_regex(self):
-        from pewtils.regex import NUMBER_REGEX
-
         for val, expected in [
             ("one 2 three", ["2"]),
             ("1234", ["1234"]),
@@ -109,8 +122,6 @@ class RegexTests(unittest.TestCase):
             self.assertEqual(result, expected)
 
     def test_nonalpha_regex(self):
-        from pewtils.regex import NONALPHA_REGEX
-
         for val, expected in [
             ("abc$efg", ["$"]),
             ("one ^%& two", [" ", "^", "%", "&", " "]),
@@ -119,3 +130,23 @@ class RegexTests(unittest.TestCase):
         ]:
             result = NONALPHA_REGEX.findall(val)
             self.assertEqual(result, expected)
+
+    def test_iter_tokens(self):
+        for val, expected in [
+            (
+                "Visit example.com to donate $5",
+                [("titleword", "Visit"), ("url", "example.com"), ("dollar", "$5")],
+            ),
+            (
+                "In 2019 http://example.com/2019 cost $1,000.50",
+                [
+                    ("titleword", "In"),
+                    ("number", "2019"),
+                    ("url", "http://example.com/2019"),
+                    ("dollar", "$1,000.50"),
+                ],
+            ),
+            ("one two three", []),
+        ]:
+            result = list(iter_tokens(val))
+            self.assertEqual(result, expected)